@@ -0,0 +1,72 @@
+import numpy as np
+
+# consumption groups reported per hour; every house is in "all", in one of the
+# EV groups and in one of the solar groups
+CONSUMPTION_GROUPS = ("all", "smart", "non_smart", "no_ev", "solar_houses", "non_solar")
+
+
+class GroupAccumulator:
+    """
+    Per-hour energy of each reporting group, updated while the simulation runs.
+
+    masks are the boolean house masks from simulation.group_masks. Base loads are
+    added once (add_profiles), EV grid energy hour by hour (add), so
+    the per-hour series and totals are ready when the last hour is simulated and
+    never need a pass over the houses afterwards.
+    """
+
+    def __init__(self, masks, hours, num_evs=0):
+        num_houses = len(masks["smart"])
+        self.masks = masks
+        self.hours = hours
+        # groups x houses membership (0/1) turns per-house energy into group sums
+        self.membership = np.vstack(
+            [np.ones(num_houses)] + [masks[name] for name in CONSUMPTION_GROUPS[1:]]
+        ).astype(float)
+        self.consumption = np.zeros((len(CONSUMPTION_GROUPS), hours))
+        self.solar_production = np.zeros(hours)
+        # estimated solar energy used by each EV (see simulation.solar_ev_energy)
+        self.solar_ev = np.zeros(num_evs)
+
+    def add_profiles(self, profiles, rows=None, block_rows=8192):
+        """
+        Add hourly consumption of many houses (rows x hours; rows default to all houses),
+        block_rows rows at a time so float32 profiles are not copied to float64 at once.
+        """
+        membership = self.membership if rows is None else self.membership[:, rows]
+        for start in range(0, len(profiles), block_rows):
+            self.consumption += membership[:, start:start + block_rows] @ profiles[start:start + block_rows]
+
+    def add(self, hour, rows, energy_Wh):
+        """Add energy drawn at one hour by houses rows (array or single row)."""
+        if np.ndim(rows):
+            self.consumption[:, hour] += self.membership[:, rows] @ energy_Wh
+        else:
+            self.consumption[:, hour] += self.membership[:, rows] * energy_Wh
+
+    def add_entries(self, rows, hours, energy_Wh):
+        """Add energy drawn by houses rows at hours (three arrays of the same length)."""
+        for g, member in enumerate(self.membership):
+            self.consumption[g] += np.bincount(hours, weights=member[rows] * energy_Wh, minlength=self.hours)
+
+    def add_solar(self, profile, count=1):
+        """Add the production of count solar houses with the same hourly profile."""
+        self.solar_production += count * np.asarray(profile)
+
+    def add_solar_ev(self, ev_index, ev_charge, solar_Wh, capacity, power):
+        """
+        Solar used by EVs ev_index at one hour: min(solar, power) when the car is home
+        (ev_charge not NaN) and not full (match model.py).
+        """
+        charging = ~np.isnan(ev_charge) & (ev_charge < capacity)
+        self.solar_ev[ev_index] += np.where(charging, np.minimum(solar_Wh, power), 0.0)
+
+    def per_hour(self):
+        per_hour = {name: self.consumption[g] for g, name in enumerate(CONSUMPTION_GROUPS)}
+        per_hour["solar_production"] = self.solar_production
+        return per_hour
+
+    def peak(self, peak_mask):
+        """Peak-hour energy of the groups reported in the totals."""
+        return {name: self.consumption[CONSUMPTION_GROUPS.index(name), peak_mask].sum()
+                for name in ("all", "smart", "non_smart")}
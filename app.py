@@ -1,7 +1,37 @@
+import gzip
+import io
+import os
+import time
 import streamlit as st
 import matplotlib.pyplot as plt
 import pandas as pd
-from simulation import run_simulation
+from result_cache import ResultCache, cache_key, result_summary
+from jobs import SimulationJob
+from profiling import RunProfile
+from export import export_npz, write_csv
+from baseline import Baseline, WhatIf
+
+# results are cached in memory (LRU) and, unless SIM_CACHE_DIR is set to "", on disk;
+# the disk copy holds only totals and series (result_summary), at most CACHE_DISK_BYTES
+CACHE_DIR = os.environ.get("SIM_CACHE_DIR", ".result_cache") or None
+CACHE_DISK_BYTES = 64 * 2**20
+
+
+@st.cache_resource
+def get_result_cache():
+    # one cache for every session of this server
+    return ResultCache(max_entries=8, directory=CACHE_DIR, max_disk_bytes=CACHE_DISK_BYTES, to_disk=result_summary)
+
+
+cache = get_result_cache()
+
+
+@st.cache_resource(max_entries=4)
+def get_what_if(num_houses, seed):
+    # loads, solar and EV order, trips and arrival charges of one neighbourhood;
+    # changing only the EV mix or the charging mode reuses them
+    return WhatIf(Baseline(num_houses, seed=seed))
+
 
 st.title("Energy case study — simulation UI")
 
@@ -9,21 +39,61 @@ num_houses = st.number_input("Number of houses", min_value=1, value=100, step=1)
 num_solar = st.number_input("Number of solar houses", min_value=0, max_value=int(num_houses), value=50, step=1)
 num_evs = st.number_input("Number of EVs", min_value=0, max_value=int(num_houses), value=20, step=1)
 num_smart = st.number_input("Number of Smart EVs", min_value=0, max_value=int(num_evs), value=10, step=1)
-
-# Run simulation and save result in session_state to avoid recomputing on UI interactions
-if st.button("Run simulation"):
-    with st.spinner("Running..."):
-        # pass seed for deterministic results consistent with simulation.py
-        res = run_simulation(int(num_houses), int(num_solar), int(num_evs), int(num_smart), seed=42)
-    st.session_state["res"] = res
-    st.session_state["params"] = (int(num_houses), int(num_solar), int(num_evs), int(num_smart))
+seed = st.number_input("Random seed", min_value=0, value=42, step=1)
+current_params = cache_key(num_houses, num_solar, num_evs, num_smart, seed)
+
+# a parameter set that was simulated before is shown straight from the cache
+cached = cache.get(current_params)
+if cached is not None:
+    st.session_state["res"] = cached
+    st.session_state["params"] = current_params
+
+# Run the simulation in a background job; the result goes into the cache and session_state
+job = st.session_state.get("job")
+# tracemalloc makes a run about 3x slower and its figures hold only while no other run is active
+trace_memory = st.checkbox("Trace memory per phase (slower)")
+if st.button("Run simulation", disabled=job is not None and job.running()):
+    # a result read back from the disk cache has no houses; running again brings the per-house downloads back
+    if cached is None or "houses" not in cached:
+        # the columnar engine gives the same results and builds house DataFrames only when downloaded
+        job = SimulationJob(*current_params, cache=cache, engine="columnar",
+                            profile=RunProfile(trace_memory=trace_memory)).start()
+        st.session_state["job"] = job
+
+if job is not None:
+    if job.running():
+        st.progress(job.fraction, text=f"Simulated {job.hours_done} of {job.hours} hours")
+        if st.button("Cancel"):
+            job.cancel()
+        time.sleep(0.25)
+        st.rerun()
+    del st.session_state["job"]
+    if job.result is not None:
+        st.session_state["res"] = job.result
+        st.session_state["params"] = job.key
+    elif job.cancelled:
+        st.info("Simulation cancelled.")
+    elif job.error is not None:
+        st.error(f"Simulation failed: {job.error}")
+
+# instant what-if on a baseline neighbourhood (Generator draws, so not the same numbers as the full run)
+if st.checkbox("Quick what-if: compare charging modes for this EV mix"):
+    what_if = get_what_if(int(num_houses), int(seed))
+    rows = {}
+    for mode in ("greedy", "coordinated"):
+        totals, per_hour = what_if.run(int(num_solar), int(num_evs), int(num_smart), charging=mode)
+        rows[mode] = {
+            "total (kWh)": totals["total_all_Wh"] / 1000,
+            "peak hours (kWh)": totals["total_peak_Wh"] / 1000,
+            "highest hour (kWh)": per_hour["all"].max() / 1000,
+        }
+    st.table(pd.DataFrame(rows).T)
 
 # If we have stored results, show them. Otherwise prompt user to run.
 if "res" not in st.session_state:
     st.info("Click 'Run simulation' to compute results. Slider changes won't trigger recomputation once results are stored.")
 else:
     # warn if inputs changed since last run
-    current_params = (int(num_houses), int(num_solar), int(num_evs), int(num_smart))
     if st.session_state.get("params") != current_params:
         st.warning("Simulation results were produced with different input parameters. Click 'Run simulation' to recompute with the new settings.")
 
@@ -52,6 +122,11 @@ else:
     # show how many smart houses had solar (model.py reported this)
     st.write(f"Smart EV houses with solar (count): {totals['counts'].get('smart_houses_with_solar', 0)}")
 
+    # energy cost per group under the time-of-use tariff (timeaxis.DEFAULT_TARIFF)
+    if "cost" in res:
+        st.write("Energy cost (time-of-use tariff):")
+        st.table(pd.Series(res["cost"], name="cost (EUR)").to_frame())
+
     day = st.slider("Select day to plot (0=day1 .. 6=day7)", 0, 6, 1)
     start = day*24
     hours = list(range(24))
@@ -90,11 +165,34 @@ else:
     st.subheader("Daily totals chart")
     st.bar_chart(df_days)
 
+    # where the last run spent its time
+    if "profile" in res:
+        with st.expander("Run profile (time, memory, counters per phase)"):
+            prof = res["profile"]
+            table = {"wall (ms)": {name: stats["wall_s"] * 1000 for name, stats in prof["phases"].items()}}
+            if prof.get("trace_memory", True):
+                table["peak memory (MB)"] = {name: stats["peak_mem_bytes"] / 1e6 for name, stats in prof["phases"].items()}
+            st.table(pd.DataFrame(table))
+            st.write(prof["counters"])
+
     # downloads
     if st.checkbox("Download daily totals CSV"):
         st.download_button("Download daily totals", data=df_days.to_csv(), file_name="daily_totals.csv", mime="text/csv")
 
-    if st.checkbox("Download results as CSV"):
-        all_houses_df = pd.concat([h.df.assign(house_id=h.house_id) for h in res["houses"]], ignore_index=True)
-        csv = all_houses_df.to_csv(index=False)
-        st.download_button("Download CSV", data=csv, file_name="simulation_results.csv", mime="text/csv")
\ No newline at end of file
+    if "houses" not in res:
+        st.info("Per-house downloads are not kept in the disk cache. Click 'Run simulation' to recompute them.")
+    elif st.checkbox("Download per-house results"):
+        export_format = st.radio("Format", ["Compressed NumPy bundle (.npz)", "Gzipped CSV"], horizontal=True)
+        if export_format == "Gzipped CSV":
+            # compressed chunk by chunk as houses are written, so the CSV text never
+            # exists as one string
+            buffer = io.BytesIO()
+            with gzip.open(buffer, "wt", newline="") as f:
+                write_csv(res, f)
+            st.download_button("Download CSV", data=buffer.getvalue(), file_name="simulation_results.csv.gz",
+                               mime="application/gzip")
+        else:
+            buffer = io.BytesIO()
+            export_npz(res, buffer)
+            st.download_button("Download .npz", data=buffer.getvalue(), file_name="simulation_results.npz",
+                               mime="application/octet-stream")
@@ -0,0 +1,78 @@
+import numpy as np
+from aggregate import CONSUMPTION_GROUPS
+
+# energy flows of the per-house balance (Wh per step)
+BALANCE_FLOWS = ("self_consumption", "solar_ev", "grid_import", "grid_export")
+# solar houses balanced at once by group_balance
+BLOCK_ROWS = 4096
+
+
+def energy_balance(household_Wh, ev_Wh, solar_Wh):
+    """
+    Energy flows of houses from household load, EV charging and solar production
+    (arrays of the same shape, Wh per step). The panels supply the household load
+    first, then the EV; what is left is exported and what they do not cover is
+    imported from the grid. Returns a dict of arrays keyed by BALANCE_FLOWS.
+    """
+    self_consumption = np.minimum(solar_Wh, household_Wh)
+    spare = solar_Wh - self_consumption
+    solar_ev = np.minimum(spare, ev_Wh)
+    return {
+        "self_consumption": self_consumption,
+        "solar_ev": solar_ev,
+        "grid_import": household_Wh - self_consumption + ev_Wh - solar_ev,
+        "grid_export": spare - solar_ev,
+    }
+
+
+def group_balance(acc, rows, consumption_of, solar_of, ev_row, ev_Wh, solar_first, block_rows=BLOCK_ROWS):
+    """
+    Energy balance of every consumption group, groups x steps per flow.
+
+    acc: GroupAccumulator of the run (its consumption is what the houses drew).
+    rows: the solar houses. consumption_of(r) / solar_of(r) return the simulated
+    consumption / production of house rows r (len(r) x steps). ev_row / ev_Wh: house
+    row and charging energy (EVs x steps) of every EV. solar_first: per EV, True
+    where the charging rules already took the charge from the panels first (smart
+    EVs at solar houses), so their grid draw was charge - min(solar, charge).
+
+    Only the solar houses are balanced matrix by matrix, block_rows houses at a
+    time so the temporaries stay small: a house without panels imports exactly what
+    it consumed.
+    """
+    steps = acc.consumption.shape[1]
+    ev_at = np.full(acc.membership.shape[1], -1)
+    ev_at[ev_row] = np.arange(len(ev_row))
+    by_group = {flow: np.zeros_like(acc.consumption) for flow in BALANCE_FLOWS}
+    by_group["grid_import"] += acc.consumption
+    for start in range(0, len(rows), block_rows):
+        block = rows[start:start + block_rows]
+        consumption = np.asarray(consumption_of(block), dtype=float)
+        solar = np.asarray(solar_of(block), dtype=float)
+        slot = ev_at[block]
+        has_ev = slot >= 0
+        ev = np.zeros((len(block), steps))
+        ev[has_ev] = ev_Wh[slot[has_ev]]
+        first = np.zeros(len(block), dtype=bool)
+        first[has_ev] = solar_first[slot[has_ev]]
+
+        # household load: what the house drew minus the grid part of its EV charging
+        ev_grid = np.where(first[:, None], ev - np.minimum(solar, ev), ev)
+        flows = energy_balance(consumption - ev_grid, ev, solar)
+        flows["grid_import"] -= consumption
+        member = acc.membership[:, block]
+        for flow in BALANCE_FLOWS:
+            by_group[flow] += member @ flows[flow]
+    return by_group
+
+
+def balance_results(by_group, steps_per_hour=1):
+    """
+    Results entry of a group_balance: per-group totals of every flow and the
+    per-hour series of all houses.
+    """
+    hours = by_group["grid_import"].shape[1] // steps_per_hour
+    return {
+        "totals": {flow: dict(zip(CONSUMPTION_GROUPS, series.sum(axis=1).tolist())) for flow, series in by_group.items()},
+        "per_hour": {flow: series[0].reshape(hours, steps_per_hour).sum(axis=1) for flow, series in by_group.items()},
+    }
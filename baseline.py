@@ -0,0 +1,236 @@
+import numpy as np
+from house import base_load_profiles
+from fleet import FleetState
+from aggregate import GroupAccumulator
+from trips import sample_trips
+from car import EV_CAPACITY_WH, EV_POWER_W
+from simulation import aligned_solar_profile, group_masks, finish_totals, build_totals, solar_ev_energy, CHARGING_MODES
+from timeaxis import time_axis
+from coordination import schedule_fleet
+
+
+class Baseline:
+    """
+    Seed-dependent inputs that do not change between scenarios of one neighbourhood:
+    household base loads, the aligned solar profile, the order in which houses get
+    solar panels and EVs, and each EV's initial charge, trip schedule and arrival
+    charges.
+
+    A scenario (num_solar, num_evs, num_smart_evs) takes the first num_solar houses of
+    solar_order and the first num_evs houses of ev_order; the first num_smart_evs of
+    those EVs are smart. Scenarios built from one Baseline therefore share all their
+    random inputs (common random numbers), and simulate() only runs the charging.
+    """
+
+    def __init__(self, num_houses, seed=42, hours=168, max_evs=None, capacity=EV_CAPACITY_WH, power=EV_POWER_W):
+        rng = np.random.default_rng(seed)
+        if max_evs is None:
+            max_evs = num_houses
+        self.num_houses = num_houses
+        self.hours = hours
+        self.capacity = capacity
+        self.power = power
+
+        self.base_load = base_load_profiles(num_houses, rng, hours)
+        self.base_load.setflags(write=False)
+        self.solar_profile = aligned_solar_profile(hours)
+        self.solar_order = rng.permutation(num_houses)
+        self.ev_order = rng.permutation(num_houses)[:max_evs]
+
+        # per EV (in ev_order): initial charge, daily leave/return hours and arrival charge
+        self.days = -(-hours // 24)
+        self.initial_charge = rng.integers(1000, 60000, size=max_evs)
+        self.leave, self.ret = sample_trips(max_evs, self.days, rng)
+        self.arrival_charge = rng.integers(int(0.10 * capacity), int(0.40 * capacity) + 1, size=(max_evs, self.days))
+
+    @property
+    def max_evs(self):
+        return len(self.ev_order)
+
+    def check(self, num_solar, num_evs, num_smart_evs):
+        if not 0 <= num_solar <= self.num_houses:
+            raise ValueError(f"num_solar must be between 0 and {self.num_houses}")
+        if not 0 <= num_evs <= self.max_evs:
+            raise ValueError(f"num_evs must be between 0 and {self.max_evs}")
+        if not 0 <= num_smart_evs <= num_evs:
+            raise ValueError("num_smart_evs must be between 0 and num_evs")
+
+
+def simulate_baseline(baseline, num_solar, num_evs, num_smart_evs, charging="greedy"):
+    """
+    Run one scenario on a Baseline with the columnar engine.
+    charging="coordinated" schedules the smart EVs by valley filling, as in run_simulation.
+    Returns (totals, per_hour) as in run_simulation.
+    """
+    if charging not in CHARGING_MODES:
+        raise ValueError(f"unknown charging mode {charging!r}, expected one of {CHARGING_MODES}")
+    coordinated = charging == "coordinated"
+    baseline.check(num_solar, num_evs, num_smart_evs)
+    hours = baseline.hours
+    fleet = FleetState(baseline.num_houses, num_evs, hours=hours)
+    fleet.consumption[:] = baseline.base_load
+
+    solar_rows = baseline.solar_order[:num_solar]
+    fleet.set_solar(solar_rows, baseline.solar_profile)
+
+    fleet.register_evs(baseline.ev_order[:num_evs], baseline.capacity, baseline.power,
+                       np.arange(num_evs) < num_smart_evs, baseline.initial_charge[:num_evs])
+
+    masks = group_masks(fleet.has_solar, fleet.ev_row, fleet.smart)
+    acc = GroupAccumulator(masks, hours, num_evs)
+    acc.add_profiles(baseline.base_load)
+    acc.add_solar(baseline.solar_profile, num_solar)
+    tracked = np.flatnonzero(fleet.smart & fleet.has_solar[fleet.ev_row])
+    tracked_rows = fleet.ev_row[tracked]
+    if coordinated:
+        # smart EVs charge by schedule after the loop, which also counts their solar use
+        fleet.scheduled[:num_smart_evs] = True
+        tracked, tracked_rows = tracked[:0], tracked_rows[:0]
+
+    leave, ret = baseline.leave[:num_evs], baseline.ret[:num_evs]
+    schedule = fleet.schedule_trips(leave, ret)
+    arrival_of = lambda plugged, day: baseline.arrival_charge[plugged, day]
+
+    for hour in range(hours):
+        rows, grid = fleet.step(hour, schedule, arrival_of)
+        acc.add(hour, rows, grid)
+        acc.add_solar_ev(tracked, fleet.ev_charge[tracked_rows, hour], fleet.solar_at(tracked_rows, hour),
+                         fleet.capacity[tracked], fleet.power[tracked])
+
+    if coordinated:
+        smart = slice(0, num_smart_evs)
+        rows, steps, grid, solar_ev = schedule_fleet(fleet, np.arange(num_smart_evs), leave[smart], ret[smart],
+                                                     baseline.initial_charge[smart], baseline.arrival_charge[smart],
+                                                     acc.consumption[0])
+        acc.add_entries(rows, steps, grid)
+        acc.solar_ev += solar_ev
+
+    return finish_totals(acc, fleet.axis, fleet.smart & fleet.has_solar[fleet.ev_row] & fleet.connected)
+
+
+# per-EV charging variants cached by WhatIf: (smart, solar house)
+EV_VARIANTS = ((False, False), (True, False), (True, True))
+
+
+class WhatIf:
+    """
+    Scenario results on one Baseline without re-running the charging loop.
+
+    With greedy charging an EV's grid draw depends only on its own trips and
+    charges, whether it is smart and whether its house has panels. The first time
+    a variant (EV_VARIANTS) is needed, every EV of the baseline is simulated once
+    in it and its per-hour grid draw is kept (max_evs x hours per variant). Base
+    loads are kept as running sums in solar_order and ev_order, so the base load of
+    any group is a difference of two rows. A scenario is then a few sums over the
+    cached rows of its EVs; only charging="coordinated" schedules the smart EVs
+    again, against the load of everything else.
+
+    run() gives the same results as simulate_baseline up to float rounding.
+    """
+
+    def __init__(self, baseline):
+        self.baseline = baseline
+        self._variants = {}
+        base = baseline.base_load
+        self._base_all = base.sum(axis=0)
+        self._base_solar = self._running_sum(base[baseline.solar_order])
+        self._base_ev = self._running_sum(base[baseline.ev_order])
+        self._peak = time_axis(baseline.hours).peak
+
+    @staticmethod
+    def _running_sum(profiles):
+        """(n + 1) x hours: row k is the sum of the first k profiles."""
+        sums = np.zeros((len(profiles) + 1, profiles.shape[1]))
+        np.cumsum(profiles, axis=0, out=sums[1:])
+        return sums
+
+    def variant(self, smart, solar):
+        """
+        (grid, solar_ev, connected) of every baseline EV charging as one variant:
+        max_evs x hours grid draw, solar used per EV and the plugged-in flags at the end.
+        """
+        key = (bool(smart), bool(solar))
+        if key not in self._variants:
+            self._variants[key] = self._simulate_variant(*key)
+        return self._variants[key]
+
+    def _simulate_variant(self, smart, solar):
+        b = self.baseline
+        n, hours = b.max_evs, b.hours
+        # one house per EV, holding only the EV's grid draw
+        fleet = FleetState(n, n, hours=hours)
+        if solar:
+            fleet.set_solar(slice(None), b.solar_profile)
+        fleet.register_evs(np.arange(n), b.capacity, b.power, smart, b.initial_charge)
+        schedule = fleet.schedule_trips(b.leave, b.ret)
+        arrival_of = lambda plugged, day: b.arrival_charge[plugged, day]
+        for hour in range(hours):
+            fleet.step(hour, schedule, arrival_of)
+        solar_ev = np.zeros(n)
+        if smart and solar:
+            solar_ev = solar_ev_energy(fleet.ev_charge, fleet.solar, fleet.capacity, fleet.power)
+        return fleet.consumption, solar_ev, fleet.connected.copy()
+
+    def run(self, num_solar, num_evs, num_smart_evs, charging="greedy"):
+        """Same as simulate_baseline(baseline, ...) from the cached variants. Returns (totals, per_hour)."""
+        b = self.baseline
+        if charging not in CHARGING_MODES:
+            raise ValueError(f"unknown charging mode {charging!r}, expected one of {CHARGING_MODES}")
+        b.check(num_solar, num_evs, num_smart_evs)
+        has_solar = np.zeros(b.num_houses, dtype=bool)
+        has_solar[b.solar_order[:num_solar]] = True
+        ev_rows = b.ev_order[:num_evs]
+        smart = np.arange(num_evs) < num_smart_evs
+        ev_solar = has_solar[ev_rows]
+        masks = group_masks(has_solar, ev_rows, smart)
+
+        # EV grid draw summed per (smart, solar house)
+        non_smart = ~smart
+        grid = {
+            (False, False): self.variant(False, False)[0][:num_evs][non_smart & ~ev_solar].sum(axis=0),
+            (False, True): self.variant(False, False)[0][:num_evs][non_smart & ev_solar].sum(axis=0),
+        }
+        # plugged in at the end of the run does not depend on how the cars charge
+        counted = smart & ev_solar & self.variant(False, False)[2][:num_evs]
+        if charging == "greedy":
+            for key in EV_VARIANTS[1:]:
+                grid[key] = self.variant(*key)[0][:num_evs][smart & (ev_solar == key[1])].sum(axis=0)
+            solar_ev = self.variant(True, True)[1][:num_evs]
+        else:
+            load = self._base_all + grid[False, False] + grid[False, True]
+            grid[True, False], grid[True, True], solar_ev = self._coordinate(num_smart_evs, ev_solar[smart], load)
+            solar_ev = np.pad(solar_ev, (0, num_evs - num_smart_evs))
+        solar_ev = solar_ev[counted].sum()
+
+        base_smart = self._base_ev[num_smart_evs]
+        base_ev = self._base_ev[num_evs]
+        base_solar = self._base_solar[num_solar]
+        per_hour = {
+            "all": self._base_all + grid[False, False] + grid[False, True] + grid[True, False] + grid[True, True],
+            "smart": base_smart + grid[True, False] + grid[True, True],
+            "non_smart": base_ev - base_smart + grid[False, False] + grid[False, True],
+            "no_ev": self._base_all - base_ev,
+            "solar_houses": base_solar + grid[False, True] + grid[True, True],
+            "non_solar": self._base_all - base_solar + grid[False, False] + grid[True, False],
+            "solar_production": num_solar * b.solar_profile,
+        }
+        peak = {name: per_hour[name][self._peak].sum() for name in ("all", "smart", "non_smart")}
+        return build_totals(per_hour, peak, masks, solar_ev, counted.sum()), per_hour
+
+    def _coordinate(self, num_smart, solar, load):
+        """
+        Coordinated schedules of the first num_smart EVs (solar: their houses' panels)
+        against load. Returns the summed grid draw of those without and with panels
+        and the solar used per EV.
+        """
+        b = self.baseline
+        fleet = FleetState(num_smart, num_smart, hours=b.hours)
+        fleet.set_solar(np.flatnonzero(solar), b.solar_profile)
+        fleet.register_evs(np.arange(num_smart), b.capacity, b.power, True)
+        smart = slice(0, num_smart)
+        rows, steps, grid, solar_ev = schedule_fleet(fleet, np.arange(num_smart), b.leave[smart], b.ret[smart],
+                                                     b.initial_charge[smart], b.arrival_charge[smart], load)
+        at_solar = solar[rows]
+        grid_plain = np.bincount(steps[~at_solar], weights=grid[~at_solar], minlength=b.hours)
+        grid_solar = np.bincount(steps[at_solar], weights=grid[at_solar], minlength=b.hours)
+        return grid_plain, grid_solar, solar_ev
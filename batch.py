@@ -0,0 +1,281 @@
+import argparse
+import hashlib
+import importlib
+import json
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from result_cache import ResultCache
+from data_frames import SOLAR_CSV
+from simulation import run_simulation, CHARGING_MODES
+
+# parameters of a scenario (the ones without a default are required) and the
+# run_simulation options it may set
+SCENARIO_DEFAULTS = {"num_houses": None, "num_solar": 0, "num_evs": 0, "num_smart_evs": 0, "seed": 42,
+                     "hours": 168, "charging": "greedy"}
+# modules whose source decides the results of run_simulation
+SIMULATION_MODULES = ("simulation", "house", "car", "fleet", "charging", "coordination", "aggregate", "balance",
+                      "scheduler", "trips", "timeaxis", "solar", "data_frames")
+DEFAULT_CACHE_DIR = ".batch_cache"
+DEFAULT_CACHE_BYTES = 256 * 2**20
+DEFAULT_PORT = 8765
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """Hash of the source of SIMULATION_MODULES (changes with any edit to the simulator)."""
+    digest = hashlib.sha256()
+    for name in SIMULATION_MODULES:
+        with open(importlib.import_module(name).__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+@lru_cache(maxsize=None)
+def solar_version(path=SOLAR_CSV):
+    """Hash of the contents of the solar data file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def scenario_params(scenario):
+    """
+    run_simulation arguments of one scenario (a dict with the keys of
+    SCENARIO_DEFAULTS, plus an optional "id" that is not a parameter), with the
+    defaults filled in so equal scenarios get equal parameters.
+    """
+    if not isinstance(scenario, dict):
+        raise ValueError("a scenario must be a JSON object")
+    unknown = set(scenario) - set(SCENARIO_DEFAULTS) - {"id"}
+    if unknown:
+        raise ValueError(f"unknown scenario parameters: {sorted(unknown)}")
+    params = {name: scenario.get(name, default) for name, default in SCENARIO_DEFAULTS.items()}
+    if params["num_houses"] is None:
+        raise ValueError("num_houses is required")
+    for name, value in params.items():
+        if name != "charging" and (isinstance(value, bool) or not isinstance(value, int)):
+            raise ValueError(f"{name} must be an integer")
+    if params["num_houses"] < 1 or params["hours"] < 1:
+        raise ValueError("num_houses and hours must be >= 1")
+    if not 0 <= params["num_solar"] <= params["num_houses"] or not 0 <= params["num_evs"] <= params["num_houses"]:
+        raise ValueError("num_solar and num_evs must be between 0 and num_houses")
+    if not 0 <= params["num_smart_evs"] <= params["num_evs"]:
+        raise ValueError("num_smart_evs must be between 0 and num_evs")
+    if params["charging"] not in CHARGING_MODES:
+        raise ValueError(f"charging must be one of {CHARGING_MODES}")
+    return params
+
+
+def scenario_key(params):
+    """Content address of a scenario's result: its parameters, the code and the solar data."""
+    raw = json.dumps({"params": params, "code": code_version(), "solar": solar_version()}, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _run_scenario(params):
+    """
+    One scenario in a worker; only totals and per-hour series travel back. Seeded
+    runs (the numbers of the original code), so trips are drawn per EV with the
+    scalar random module (see run_simulation's rng).
+    """
+    res = run_simulation(**params, engine="columnar")
+    return {"totals": res["totals"], "per_hour": {k: np.asarray(v) for k, v in res["per_hour"].items()}}
+
+
+def _record(scenario_id, key, result, cached):
+    """JSON line of one finished scenario."""
+    totals = {k: float(v) for k, v in result["totals"].items() if k != "counts"}
+    totals["counts"] = {k: int(v) for k, v in result["totals"]["counts"].items()}
+    return {"id": scenario_id, "key": key, "cached": cached, "totals": totals,
+            "per_hour": {k: v.tolist() for k, v in result["per_hour"].items()}}
+
+
+class BatchRunner:
+    """
+    Runs batches of scenarios with a content-addressed result cache.
+
+    A scenario's result is stored in `cache` (a ResultCache, by default on disk in
+    DEFAULT_CACHE_DIR with at most DEFAULT_CACHE_BYTES) under scenario_key, so a
+    repeated scenario is never simulated twice, within a batch, across batches or
+    across restarts; changing the simulator code or the solar data changes every
+    key. Cache misses run on a process pool of `workers` processes (default the
+    number of CPUs; 1 runs them in a thread of this process), and a scenario already
+    running for another batch is waited for instead of started again. Safe to share
+    between threads (the HTTP server runs one batch per request).
+    """
+
+    def __init__(self, cache=None, workers=None):
+        if cache is None:
+            cache = ResultCache(max_entries=32, directory=DEFAULT_CACHE_DIR, max_disk_entries=None,
+                                max_disk_bytes=DEFAULT_CACHE_BYTES)
+        self.cache = cache
+        self.workers = workers
+        self._pool = None
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def _submit(self, key, params):
+        """
+        (result, None) for a cached key, else (None, future) with the future shared by
+        every caller asking for key. The cache and _running are looked at under one
+        lock, and _finished caches a result before it leaves _running, so a key is
+        always found in one of them once it has been submitted.
+        """
+        with self._lock:
+            result = self.cache.get(key)
+            if result is not None:
+                return result, None
+            if key in self._running:
+                return None, self._running[key]
+            if self._pool is None:
+                if self.workers == 1:
+                    self._pool = ThreadPoolExecutor(1)
+                else:
+                    # spawned, not forked: the HTTP server runs batches from several threads
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            future = self._pool.submit(_run_scenario, params)
+            self._running[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return None, future
+
+    def _finished(self, key, future):
+        try:
+            if not future.cancelled() and future.exception() is None:
+                self.cache.put(key, future.result())
+        finally:
+            with self._lock:
+                self._running.pop(key, None)
+
+    def run(self, scenarios):
+        """
+        Yield one JSON-serializable record per scenario (dicts as in a JSONL line), as
+        soon as its result is known: cache hits first, then misses in the order they
+        finish. A record has id (the scenario's "id", or its position), key, cached,
+        totals and per_hour; an invalid or failed scenario gives id and error instead.
+        """
+        pending = {}
+        for index, scenario in enumerate(scenarios):
+            scenario_id = scenario.get("id", index) if isinstance(scenario, dict) else index
+            try:
+                params = scenario_params(scenario)
+            except ValueError as exc:
+                yield {"id": scenario_id, "error": str(exc)}
+                continue
+            key = scenario_key(params)
+            result, future = self._submit(key, params)
+            if result is not None:
+                yield _record(scenario_id, key, result, cached=True)
+                continue
+            pending.setdefault(future, (key, []))[1].append(scenario_id)
+
+        for future in as_completed(pending):
+            key, ids = pending[future]
+            for scenario_id in ids:
+                try:
+                    yield _record(scenario_id, key, future.result(), cached=False)
+                except Exception as exc:
+                    yield {"id": scenario_id, "key": key, "error": f"{type(exc).__name__}: {exc}"}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+def read_jsonl(lines):
+    """Scenarios from JSONL lines (blank lines skipped); a line that is not JSON becomes its text."""
+    for line in lines:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield line
+
+
+def write_jsonl(records, file):
+    """Write records as JSON lines, flushing after each so readers see them as they finish."""
+    for record in records:
+        file.write(json.dumps(record) + "\n")
+        file.flush()
+
+
+def serve(runner, host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    Local HTTP endpoint: POST a JSONL body of scenarios (or a JSON list) and read the
+    records of BatchRunner.run back as a JSONL stream. Runs until interrupted.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            stripped = body.lstrip()
+            try:
+                scenarios = json.loads(body) if stripped.startswith("[") else list(read_jsonl(body.splitlines()))
+            except json.JSONDecodeError as exc:
+                self.send_error(400, f"invalid JSON: {exc}")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            # HTTP/1.0 without Content-Length: the stream ends when the connection closes
+            for record in runner.run(scenarios):
+                self.wfile.write((json.dumps(record) + "\n").encode())
+                self.wfile.flush()
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"serving scenarios on http://{host}:{server.server_address[1]}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    """
+    python batch.py scenarios.jsonl [--out results.jsonl]   (- reads stdin)
+    python batch.py --serve [--port 8765]
+    """
+    parser = argparse.ArgumentParser(prog="python batch.py", description="Batch scenario runner with a result cache.")
+    parser.add_argument("scenarios", nargs="?", help="JSONL file of scenarios (- for stdin)")
+    parser.add_argument("--out", help="write the result records to this JSONL file (default stdout)")
+    parser.add_argument("--serve", action="store_true", help="serve a local HTTP endpoint instead")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, help="worker processes (default the number of CPUs)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache-mb", type=float, default=DEFAULT_CACHE_BYTES / 2**20, help="size limit of the cache directory")
+    args = parser.parse_args(argv)
+    if args.serve == (args.scenarios is not None):
+        parser.error("give a scenarios file or --serve")
+
+    cache = ResultCache(max_entries=32, directory=args.cache_dir, max_disk_entries=None,
+                        max_disk_bytes=int(args.cache_mb * 2**20))
+    runner = BatchRunner(cache, workers=args.workers)
+    try:
+        if args.serve:
+            serve(runner, args.host, args.port)
+        else:
+            source = sys.stdin if args.scenarios == "-" else open(args.scenarios)
+            out = sys.stdout if args.out is None else open(args.out, "w")
+            try:
+                write_jsonl(runner.run(read_jsonl(source)), out)
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+                if out is not sys.stdout:
+                    out.close()
+    finally:
+        runner.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from profiling import RunProfile
+from simulation import run_simulation, aggregate_from_dataframes, ENGINES
+
+SIZES = (10, 100, 1_000, 10_000, 100_000)
+# fixed shares of the houses: solar panels, EVs, and smart EVs among the EVs
+SOLAR_SHARE = 0.4
+EV_SHARE = 0.3
+SMART_SHARE = 0.5
+# the DataFrame engine is only benchmarked up to this size (it is the slow reference)
+DATAFRAME_MAX_HOUSES = 1_000
+# totals of optimized engines must match the reference within this relative tolerance
+CHECK_RTOL = 1e-9
+CHECK_MAX_HOUSES = 1_000
+# the reference engine's streaming aggregates are also checked against a scan of
+# every house DataFrame (aggregate_from_dataframes, slow) up to this size
+POST_HOC_MAX_HOUSES = 100
+# totals of scenario(GOLDEN_HOUSES) with seed 42 over 168 hours from the original
+# simulation.py (the first commit), before any engine was rewritten; the reference
+# engine must still produce them
+GOLDEN_HOUSES = 100
+GOLDEN_TOTALS = {
+    "total_all_Wh": 12902857.596666668,
+    "total_smart_Wh": 4508709.596666667,
+    "total_non_smart_Wh": 5076592.0,
+    "total_no_ev_Wh": 3317556.0,
+    "average_smart_Wh": 300580.6397777778,
+    "average_non_smart_Wh": 338439.4666666667,
+    "average_no_ev_Wh": 47393.65714285714,
+    "total_peak_Wh": 4315105.699999999,
+    "total_peak_smart_Wh": 1078279.7000000002,
+    "total_peak_non_smart_Wh": 1725589.0,
+    "total_solar_ev_Wh": 96304.40333333329,
+    "total_solar_production_Wh": 1157139.733333333,
+    "counts": {"num_houses": 100, "num_smart": 15, "num_non_smart": 15, "num_no_ev": 70, "smart_houses_with_solar": 6},
+}
+# documented memory of the compact engine: peak resident memory per house and
+# simulated hour (float32 consumption / ev_charge rows of 672 bytes each, the EV
+# rows, the House and Car records and the temporaries of the run). Measured as the
+# slope between the two largest benchmarked sizes, which must both have at least
+# MEMORY_CHECK_MIN_HOUSES houses: below that the fixed cost of the interpreter,
+# NumPy and the solar data dominates. One-week runs at hourly steps gave 12.9 to
+# 16.7 bytes for the pairs 10k/50k, 10k/100k and 20k/100k houses (allocator and
+# page granularity); the budget leaves about 40% above that.
+COMPACT_BYTES_PER_HOUSE_HOUR = 24
+MEMORY_CHECK_MIN_HOUSES = 10_000
+# bytes of the compact engine's FleetState arrays per house and simulated hour, an
+# exact count unlike the resident-memory slope: float32 consumption and ev_charge
+# (8 bytes), ev_energy for the EV_SHARE of houses with an EV (1.2) and the
+# per-house and per-EV vectors; 9.35 for scenario(FLEET_CHECK_HOUSES) over a week
+COMPACT_FLEET_BYTES_PER_HOUSE_HOUR = 10
+FLEET_CHECK_HOUSES = 1_000
+
+
+def scenario(num_houses):
+    """run_simulation arguments for num_houses houses with the fixed shares."""
+    num_evs = int(EV_SHARE * num_houses)
+    return {
+        "num_houses": num_houses,
+        "num_solar": int(SOLAR_SHARE * num_houses),
+        "num_evs": num_evs,
+        "num_smart_evs": int(SMART_SHARE * num_evs)
+    }
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _bench_point(num_houses, engine, seed, repeat, hours):
+    """
+    Benchmark one size and engine; runs in a fresh process so the peak resident
+    memory belongs to this point only. The best of `repeat` runs is reported.
+    """
+    best = None
+    for _ in range(repeat):
+        prof = RunProfile(trace_memory=False)
+        run_simulation(**scenario(num_houses), seed=seed, engine=engine, hours=hours, profile=prof)
+        if best is None or prof.wall_s < best.wall_s:
+            best = prof
+    return {
+        "houses": num_houses,
+        "engine": engine,
+        "hours": hours,
+        "wall_s": best.wall_s,
+        "house_hours_per_s": num_houses * hours / best.wall_s,
+        "peak_rss_mb": _peak_rss_bytes() / 1e6,
+        "phases_s": {name: stats["wall_s"] for name, stats in best.phases.items()},
+        "counters": best.counters
+    }
+
+
+def run_point(num_houses, engine, seed=42, repeat=1, hours=168):
+    """_bench_point in a freshly spawned worker process."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_bench_point, num_houses, engine, seed, repeat, hours).result()
+
+
+def _mismatches(ref_totals, ref_per_hour, totals, per_hour):
+    """Keys of totals / per-hour series that differ from the reference ones."""
+    bad = [k for k, v in ref_totals.items() if k != "counts" and not np.isclose(v, totals[k], rtol=CHECK_RTOL)]
+    if ref_totals["counts"] != totals["counts"]:
+        bad.append("counts")
+    bad += [f"per_hour.{k}" for k, v in ref_per_hour.items() if not np.allclose(v, per_hour[k], rtol=CHECK_RTOL)]
+    return bad
+
+
+def check_engines(num_houses, seed=42, hours=168, reference="dataframe"):
+    """
+    Correctness check: every other engine must reproduce the totals and per-hour
+    series of the reference engine for the same seed. The reference itself must
+    match aggregate_from_dataframes on its houses up to POST_HOC_MAX_HOUSES houses
+    ("post_hoc") and, for scenario(GOLDEN_HOUSES) with seed 42 over 168 hours, the
+    totals of the original code ("golden"). Returns a dict with the mismatching keys per engine (empty lists
+    when everything matches).
+    """
+    params = scenario(num_houses)
+    ref = run_simulation(**params, seed=seed, engine=reference, hours=hours)
+    mismatches = {}
+    if num_houses <= POST_HOC_MAX_HOUSES:
+        mismatches["post_hoc"] = _mismatches(*aggregate_from_dataframes(ref["houses"], ref["solar_houses"]),
+                                             ref["totals"], ref["per_hour"])
+    if (num_houses, seed, hours) == (GOLDEN_HOUSES, 42, 168):
+        mismatches["golden"] = _mismatches(GOLDEN_TOTALS, {}, ref["totals"], {})
+    for engine in ENGINES:
+        if engine == reference:
+            continue
+        res = run_simulation(**params, seed=seed, engine=engine, hours=hours)
+        mismatches[engine] = _mismatches(ref["totals"], ref["per_hour"], res["totals"], res["per_hour"])
+    return {"houses": num_houses, "reference": reference, "mismatches": mismatches}
+
+
+def memory_check(points, engine="compact", budget=COMPACT_BYTES_PER_HOUSE_HOUR):
+    """
+    Peak resident memory per house and hour of `engine` against the documented
+    budget, or None when the benchmark did not cover a large enough size range.
+    """
+    points = sorted((p for p in points if p["engine"] == engine), key=lambda p: p["houses"])
+    if len(points) < 2 or points[-2]["houses"] < MEMORY_CHECK_MIN_HOUSES:
+        return None
+    small, large = points[-2], points[-1]
+    per_house_hour = (large["peak_rss_mb"] - small["peak_rss_mb"]) * 1e6 / (large["houses"] - small["houses"]) / large["hours"]
+    return {"engine": engine, "bytes_per_house_hour": per_house_hour, "budget": budget, "ok": per_house_hour <= budget}
+
+
+def fleet_bytes(fleet):
+    """Bytes held by the NumPy arrays of a FleetState (its matrices, vectors and calendar)."""
+    return sum(value.nbytes for value in vars(fleet).values() if isinstance(value, np.ndarray))
+
+
+def fleet_memory_check(num_houses=FLEET_CHECK_HOUSES, engine="compact", seed=42, hours=168,
+                       budget=COMPACT_FLEET_BYTES_PER_HOUSE_HOUR):
+    """FleetState bytes per house and hour of one `engine` run against the budget (deterministic)."""
+    res = run_simulation(**scenario(num_houses), seed=seed, engine=engine, hours=hours)
+    per_house_hour = fleet_bytes(res["houses"][0].fleet) / num_houses / hours
+    return {"engine": engine, "houses": num_houses, "fleet_bytes_per_house_hour": per_house_hour, "budget": budget,
+            "ok": per_house_hour <= budget}
+
+
+def run_benchmark(sizes=SIZES, engines=ENGINES, seed=42, repeat=1, hours=168, check=True, log=None):
+    """Run every (size, engine) point and the correctness checks; returns the report dict."""
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "seed": seed,
+            "hours": hours,
+            "shares": {"solar": SOLAR_SHARE, "evs": EV_SHARE, "smart": SMART_SHARE}
+        },
+        "results": [],
+        "checks": [],
+        "memory": None,
+        "fleet_memory": None
+    }
+    for num_houses in sizes:
+        for engine in engines:
+            if engine == "dataframe" and num_houses > DATAFRAME_MAX_HOUSES:
+                continue
+            point = run_point(num_houses, engine, seed, repeat, hours)
+            report["results"].append(point)
+            if log is not None:
+                log(f"{engine:>10} {num_houses:>7} houses: {point['wall_s']:8.2f} s, "
+                    f"{point['house_hours_per_s']:12,.0f} house-hours/s, {point['peak_rss_mb']:8.1f} MB")
+
+    report["memory"] = memory_check(report["results"])
+    if log is not None and report["memory"] is not None:
+        memory = report["memory"]
+        log(f"{'memory':>10} {memory['engine']}: {memory['bytes_per_house_hour']:.1f} bytes per house-hour "
+            f"(budget {memory['budget']}): {'OK' if memory['ok'] else 'OVER BUDGET'}")
+
+    # checks run in this process after the timed points: a spawned worker inherits
+    # the parent's peak resident memory, so the parent must stay small until then
+    for num_houses in sizes:
+        if check and num_houses <= CHECK_MAX_HOUSES:
+            result = check_engines(num_houses, seed, hours)
+            report["checks"].append(result)
+            if log is not None:
+                failed = {e: bad for e, bad in result["mismatches"].items() if bad}
+                log(f"{'check':>10} {num_houses:>7} houses: {'MISMATCH ' + str(failed) if failed else 'OK'}")
+    if "compact" in engines:
+        fleet_memory = report["fleet_memory"] = fleet_memory_check(seed=seed, hours=hours)
+        if log is not None:
+            log(f"{'fleet':>10} compact: {fleet_memory['fleet_bytes_per_house_hour']:.2f} bytes per house-hour "
+                f"(budget {fleet_memory['budget']}): {'OK' if fleet_memory['ok'] else 'OVER BUDGET'}")
+    return report
+
+
+def compare(report, baseline, tolerance=0.2):
+    """
+    Regressions of report against a stored baseline report: points whose
+    throughput dropped, or whose peak memory grew, by more than tolerance (a
+    fraction), plus failed correctness and memory checks. Returns a list of messages.
+    """
+    regressions = []
+    old = {(r["houses"], r["engine"], r.get("hours", 168)): r for r in baseline["results"]}
+    for new in report["results"]:
+        ref = old.get((new["houses"], new["engine"], new["hours"]))
+        if ref is None:
+            continue
+        label = f"{new['engine']} {new['houses']} houses"
+        if new["house_hours_per_s"] < (1 - tolerance) * ref["house_hours_per_s"]:
+            regressions.append(f"{label}: throughput {new['house_hours_per_s']:,.0f} vs "
+                               f"{ref['house_hours_per_s']:,.0f} house-hours/s")
+        if new["peak_rss_mb"] > (1 + tolerance) * ref["peak_rss_mb"]:
+            regressions.append(f"{label}: peak memory {new['peak_rss_mb']:.1f} vs {ref['peak_rss_mb']:.1f} MB")
+    for check in report["checks"]:
+        for engine, bad in check["mismatches"].items():
+            if bad and engine in ENGINES:
+                regressions.append(f"{engine} {check['houses']} houses: totals differ from {check['reference']} in {bad}")
+            elif bad:
+                # post_hoc / golden: the reference engine against the DataFrame scan / the original totals
+                regressions.append(f"{check['reference']} {check['houses']} houses: totals differ from {engine} in {bad}")
+    memory = report.get("memory")
+    if memory is not None and not memory["ok"]:
+        regressions.append(f"{memory['engine']}: {memory['bytes_per_house_hour']:.1f} bytes per house-hour, "
+                           f"budget {memory['budget']}")
+    fleet_memory = report.get("fleet_memory")
+    if fleet_memory is not None and not fleet_memory["ok"]:
+        regressions.append(f"{fleet_memory['engine']}: {fleet_memory['fleet_bytes_per_house_hour']:.2f} FleetState "
+                           f"bytes per house-hour, budget {fleet_memory['budget']}")
+    return regressions
+
+
+def main(argv=None):
+    """
+    python -m benchmark --out bench.json [--compare baseline.json]
+    Exits with status 1 when --compare finds a regression, a correctness check fails
+    or the compact engine is over one of its memory budgets.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Scaling benchmark of run_simulation.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="numbers of houses")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--hours", type=int, default=168)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per point (the fastest is kept)")
+    parser.add_argument("--no-check", action="store_true", help="skip the engine correctness checks")
+    parser.add_argument("--out", help="write the report to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown / memory growth (default 0.2)")
+    args = parser.parse_args(argv)
+
+    log = lambda line: print(line, file=sys.stderr)
+    report = run_benchmark(args.sizes, args.engines, args.seed, args.repeat, args.hours, not args.no_check, log)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = any(bad for check in report["checks"] for bad in check["mismatches"].values())
+    failed = failed or any(report[name] is not None and not report[name]["ok"] for name in ("memory", "fleet_memory"))
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            log(f"REGRESSION {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,20 @@
 from house import House
 import numpy as np
 
+# battery capacity (Wh) and charging power (W) of every simulated EV
+EV_CAPACITY_WH = 60_000
+EV_POWER_W = 3200
+
 class Car:
-    def __init__(self, car_id, house=None, capacity=60_000, current_charge=0, power=3200, smart=False):
+    __slots__ = ("car_id", "fleet", "index", "capacity", "_current_charge", "power", "house", "smart", "_connected")
+
+    def __init__(self, car_id, house=None, capacity=EV_CAPACITY_WH, current_charge=0, power=EV_POWER_W, smart=False, fleet=None, index=None):
         self.car_id = car_id
+        # When a FleetState is given, charge and connection state live in fleet.soc / fleet.connected[index]
+        self.fleet = fleet
+        self.index = index
+        if fleet is not None:
+            fleet.register_ev(index, house.row, capacity, power, smart)
         self.capacity = capacity  # in Wh
         self.current_charge = current_charge  # in Wh
         self.power = power  # charging power in W (same as Wh/h)
@@ -11,21 +22,54 @@ class Car:
         self.smart = smart
         self.connected = True   # True when plugged at home
 
+    @property
+    def current_charge(self):
+        if self.fleet is not None:
+            return self.fleet.soc[self.index]
+        return self._current_charge
+
+    @current_charge.setter
+    def current_charge(self, value):
+        if self.fleet is not None:
+            self.fleet.soc[self.index] = value
+        else:
+            self._current_charge = value
+
+    @property
+    def connected(self):
+        if self.fleet is not None:
+            return bool(self.fleet.connected[self.index])
+        return self._connected
+
+    @connected.setter
+    def connected(self, value):
+        if self.fleet is not None:
+            self.fleet.connected[self.index] = value
+        else:
+            self._connected = value
+
     def unplug(self, hour):
-        """Mark the car as away/unplugged and set house df to -1000 for this hour (caller may set range)."""
+        """Mark the car as away/unplugged and set house ev_charge to NaN for this hour (caller may set range)."""
+        if self.fleet is not None:
+            # through the fleet so the car also leaves its active charging set
+            self.fleet.unplug(self.index, hour)
+            return
         self.connected = False
         if self.house is not None:
             try:
-                self.house.df.loc[hour, "ev_charge_Wh"] = np.nan
+                self.house.set_ev_charge(hour, np.nan)
             except Exception:
                 pass
 
     def plug(self, hour):
-        """Mark the car as connected and set the house df ev_charge to current_charge at the plug hour."""
+        """Mark the car as connected and set the house ev_charge to current_charge at the plug hour."""
+        if self.fleet is not None:
+            self.fleet.plug(self.index, hour, self.current_charge)
+            return
         self.connected = True
         if self.house is not None:
             try:
-                self.house.df.loc[hour, "ev_charge_Wh"] = self.current_charge
+                self.house.set_ev_charge(hour, self.current_charge)
             except Exception:
                 pass
 
@@ -39,34 +83,34 @@ class Car:
             return 0  # already full, no charging
 
         charge_energy = 0  # initialize
-        hour_of_the_day = self.house.df.loc[hour, "time"].hour
         if self.smart:
             #Check if the house has solar:
             if self.house.has_solar:
-                solar_available = self.house.df.loc[hour, "solar_production_Wh"]
+                solar_available = self.house.solar_at(hour)
                 # Use solar first, up to power limit
                 charge_energy = min(solar_available, self.power)
                 # If solar not enough, take rest from grid
                 if charge_energy < self.power:
                     extra_needed = self.power - charge_energy
                     charge_energy += extra_needed
-                    self.house.df.loc[hour, "energy_consumption_Wh"] += extra_needed
+                    self.house.add_consumption(hour, extra_needed)
             
             # if the house is not solar
-            elif (18<=hour_of_the_day<=21) or (6<=hour_of_the_day<=9):
+            # reduced power in the 6-9 am / 6-9 pm window (timeaxis.REDUCED_POWER_WINDOWS)
+            elif self.house.reduced_power_at(hour):
                 charge_energy += 0.3*self.power
                 charge_energy = min(charge_energy, self.capacity - self.current_charge)
-                self.house.df.loc[hour, "energy_consumption_Wh"] += charge_energy
+                self.house.add_consumption(hour, charge_energy)
             else:
                 charge_energy += self.power
                 charge_energy = min(charge_energy, self.capacity - self.current_charge)
-                self.house.df.loc[hour, "energy_consumption_Wh"] += charge_energy
+                self.house.add_consumption(hour, charge_energy)
                 
             
         else:
             # Non-smart: always charge at full power
             charge_energy = self.power
             charge_energy = min(charge_energy, self.capacity - self.current_charge)
-            self.house.df.loc[hour, "energy_consumption_Wh"] += charge_energy
+            self.house.add_consumption(hour, charge_energy)
 
         return charge_energy
@@ -0,0 +1,44 @@
+import numpy as np
+
+# share of the power smart EVs without solar use in the reduced-power window
+REDUCED_POWER_FACTOR = 0.3
+
+
+def charge_step(soc, capacity, power, smart, has_solar, connected, solar_Wh, reduced_power):
+    """
+    Batched version of Car.charge for one step and many EVs.
+
+    All arguments are arrays with one entry per EV; reduced_power (whether the step
+    is in the reduced-power window, TimeAxis.reduced_power) is usually a scalar.
+    Returns (charge_Wh, grid_Wh): energy added to each battery and energy drawn from
+    the grid for it. Both are 0 for cars that are away or already full, and the
+    numbers are the same Car.charge would return / add to energy_consumption_Wh:
+      - non-smart: full power, capped by the remaining capacity
+      - smart with solar: full power, solar first and the rest from the grid
+      - smart without solar: 30% power in the 6-9 / 18-21 window, else full power,
+        capped by the remaining capacity
+    """
+    soc = np.asarray(soc, dtype=float)
+    capacity = np.asarray(capacity, dtype=float)
+    power = np.asarray(power, dtype=float)
+    smart = np.asarray(smart, dtype=bool)
+    has_solar = np.asarray(has_solar, dtype=bool)
+
+    active = np.asarray(connected, dtype=bool) & (soc < capacity)
+    remaining = capacity - soc
+
+    # rate for everything except smart+solar, which is handled below
+    reduced = smart & ~has_solar & reduced_power
+    rate = np.where(reduced, REDUCED_POWER_FACTOR * power, power)
+    charge = np.minimum(rate, remaining)
+    grid = charge
+
+    # smart with solar: always full power (not capped), grid covers what solar can't
+    solar_smart = smart & has_solar
+    if solar_smart.any():
+        charge = np.where(solar_smart, power, charge)
+        grid = np.where(solar_smart, power - np.minimum(solar_Wh, power), grid)
+
+    charge = np.where(active, charge, 0.0)
+    grid = np.where(active, grid, 0.0)
+    return charge, grid
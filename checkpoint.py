@@ -0,0 +1,147 @@
+import io
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+
+# file signature, then one record per write: kind (4 bytes), payload length, payload
+# (uncompressed .npz: arrays plus a JSON "meta" entry) and the CRC-32 of the payload
+MAGIC = b"ECSCKPT1"
+HEAD = b"HEAD"
+STATE = b"STAT"
+_FRAME = struct.Struct("<4sQ")
+_CRC = struct.Struct("<I")
+
+
+def _encode(meta, arrays):
+    buffer = io.BytesIO()
+    np.savez(buffer, meta=np.array(json.dumps(meta)), **arrays)
+    return buffer.getvalue()
+
+
+def _decode(payload):
+    with np.load(io.BytesIO(payload)) as data:
+        arrays = {name: data[name] for name in data.files}
+    return json.loads(str(arrays.pop("meta"))), arrays
+
+
+def _record(kind, payload):
+    return _FRAME.pack(kind, len(payload)) + payload + _CRC.pack(zlib.crc32(payload))
+
+
+def read_checkpoint(path):
+    """
+    Records of a checkpoint file: (head, states, end). head is the (meta, arrays) of
+    the HEAD record, states the (meta, arrays) of every complete STAT record in file
+    order, end the byte offset just after the last of them. A record cut short or
+    damaged by a crash during its write ends the file there.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a checkpoint file")
+        head, states, end = None, [], f.tell()
+        while True:
+            frame = f.read(_FRAME.size)
+            if len(frame) < _FRAME.size:
+                break
+            kind, length = _FRAME.unpack(frame)
+            payload = f.read(length)
+            crc = f.read(_CRC.size)
+            if len(payload) < length or len(crc) < _CRC.size or _CRC.unpack(crc)[0] != zlib.crc32(payload):
+                break
+            if kind == HEAD:
+                head = _decode(payload)
+            elif kind == STATE:
+                states.append(_decode(payload))
+            end = f.tell()
+    if head is None:
+        raise ValueError(f"{path} has no complete HEAD record")
+    return head, states, end
+
+
+class CheckpointWriter:
+    """
+    Append-only checkpoint file written by a background thread.
+
+    The HEAD record (run parameters and everything fixed for the run) is written
+    once when the file is created; write() then queues STAT records, which the thread
+    encodes, appends and fsyncs while the caller carries on. Pass arrays the caller
+    will not change afterwards (copies). At most `pending` records wait in the
+    queue; write() blocks beyond that. close() waits for every queued record and
+    raises any error the thread met.
+
+    CheckpointWriter(path, head=(meta, arrays)) starts a new file;
+    CheckpointWriter(path, end=offset) continues an existing one, first cutting it at
+    offset (read_checkpoint's end) to drop a partly written record.
+    """
+
+    def __init__(self, path, head=None, end=None, pending=2):
+        if (head is None) == (end is None):
+            raise ValueError("give either head (new file) or end (resumed file)")
+        if head is None:
+            self._file = open(path, "r+b")
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file = open(path, "wb")
+            self._file.write(MAGIC + _record(HEAD, _encode(*head)))
+            self._sync()
+        self.error = None
+        self._queue = queue.Queue(maxsize=pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self._file.write(_record(STATE, _encode(*item)))
+                    self._sync()
+                except Exception as exc:
+                    self.error = exc
+
+    def write(self, meta, arrays):
+        """Queue one STAT record (meta: JSON-serializable dict, arrays: name -> array)."""
+        if self.error is not None:
+            raise self.error
+        self._queue.put((meta, arrays))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self.error is not None:
+            raise self.error
+
+
+def rng_state(rng):
+    """JSON-serializable state of a numpy Generator (see restore_rng)."""
+    def plain(value):
+        if isinstance(value, dict):
+            return {key: plain(v) for key, v in value.items()}
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        if isinstance(value, np.integer):
+            return int(value)
+        return value
+    return plain(rng.bit_generator.state)
+
+
+def restore_rng(state):
+    """Generator continuing exactly where the one saved by rng_state stopped."""
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    if isinstance(state["state"].get("key"), list):
+        # MT19937 keeps its key as a uint32 array
+        state = dict(state, state=dict(state["state"], key=np.array(state["state"]["key"], dtype=np.uint32)))
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
@@ -0,0 +1,155 @@
+import numpy as np
+from charging import REDUCED_POWER_FACTOR
+
+# sessions are water-filled in this many interleaved batches (see valley_fill)
+DEFAULT_BATCHES = 64
+
+
+def plug_windows(leave, ret, steps):
+    """
+    Plug-in sessions of every EV from its leave/return steps (EVs x days arrays, as
+    used by EventSchedule): from step 0, where every car starts at home, to its first
+    leave, and from each return to the next leave or the end of the run.
+    Returns (ev, start, stop, day) arrays, one entry per session with start < stop;
+    day is the day of the return that opened the session (-1 for the first one).
+    """
+    n_evs, days = leave.shape
+    start = np.hstack([np.zeros((n_evs, 1), dtype=np.int64), ret]).ravel()
+    stop = np.hstack([leave, np.full((n_evs, 1), steps, dtype=np.int64)]).ravel()
+    day = np.tile(np.arange(-1, days), n_evs)
+    ev = np.repeat(np.arange(n_evs), days + 1)
+    stop = np.minimum(stop, steps)
+    keep = start < stop
+    return ev[keep], start[keep], stop[keep], day[keep]
+
+
+def _fill_levels(load, energy, power):
+    """
+    Water level per row: the lambda with sum(clip(lambda - load, 0, power)) == energy,
+    for all rows at once. load is sessions x W with inf outside the window.
+    The filled energy is piecewise linear in lambda, its slope going up by one at
+    every load value and down by one at every load + power, so one sort of those
+    breakpoints gives it exactly.
+    """
+    points = np.concatenate([load, load + power[:, None]], axis=1)
+    order = np.argsort(points, axis=1)
+    points = np.take_along_axis(points, order, axis=1)
+    slope = np.cumsum(np.where(order < load.shape[1], 1, -1), axis=1)
+    with np.errstate(invalid="ignore"):
+        gaps = np.diff(points, axis=1)
+    # no slope left past the last finite breakpoint (inf - inf is nan)
+    gaps[~np.isfinite(gaps)] = 0.0
+    filled = np.zeros(points.shape)
+    np.cumsum(slope[:, :-1] * gaps, axis=1, out=filled[:, 1:])
+    # last breakpoint with less than `energy` filled; lambda is on the segment after it
+    # (at most the last finite one, which rounding can leave just short of `energy`)
+    k = np.minimum((filled < energy[:, None]).sum(axis=1), np.isfinite(points).sum(axis=1)) - 1
+    rows = np.arange(len(k))
+    return points[rows, k] + (energy - filled[rows, k]) / np.maximum(slope[rows, k], 1)
+
+
+def valley_fill(load, start, stop, energy, power, batches=DEFAULT_BATCHES):
+    """
+    Coordinated charging schedules that fill the valleys of an aggregate load.
+
+    load: aggregate energy per step that the schedules are added to (Wh).
+    start, stop: plug-in window [start, stop) of every session (steps).
+    energy: energy to deliver in each session (Wh, at most power x window length).
+    power: maximum energy per step of each session (Wh).
+
+    Every session water-fills its window: it charges up to a level lambda on top
+    of the current aggregate, never above power per step, so the load inside the
+    window ends as flat as possible. Sessions are processed in `batches` rounds;
+    each round takes every batches-th session in order of arrival, fills against
+    the aggregate left by the previous rounds and adds its schedules to it. Each
+    round is one vectorized sort over its sessions' windows, so the cost is close
+    to linear in the number of sessions times the longest window.
+
+    Returns (alloc, load): alloc is sessions x W (W = longest window), column j
+    being step start + j of the session; load is the aggregate with every schedule.
+    """
+    load = np.array(load, dtype=float)
+    start = np.asarray(start, dtype=np.int64)
+    length = np.asarray(stop, dtype=np.int64) - start
+    energy = np.asarray(energy, dtype=float)
+    power = np.broadcast_to(np.asarray(power, dtype=float), start.shape)
+    n = len(start)
+    width = int(length.max()) if n else 0
+    alloc = np.zeros((n, width))
+    if n == 0 or width == 0:
+        return alloc, load
+
+    offsets = np.arange(width)
+    order = np.argsort(start, kind="stable")
+    for b in range(min(batches, n)):
+        idx = order[b::batches]
+        idx = idx[energy[idx] > 0]
+        if not len(idx):
+            continue
+        inside = offsets < length[idx, None]
+        cols = np.where(inside, start[idx, None] + offsets, 0)
+        current = np.where(inside, load[cols], np.inf)
+        level = _fill_levels(current, energy[idx], power[idx])
+        fill = np.clip(level[:, None] - current, 0.0, power[idx, None])
+        # rounding leaves a tiny residual; rescale to deliver exactly `energy`
+        total = fill.sum(axis=1)
+        fill *= np.divide(energy[idx], total, out=np.zeros_like(total), where=total > 0)[:, None]
+        alloc[idx] = fill
+        load += np.bincount(cols[inside], weights=fill[inside], minlength=len(load))
+    return alloc, load
+
+
+def schedule_fleet(fleet, index, leave, ret, initial_soc, arrival, load, batches=DEFAULT_BATCHES):
+    """
+    Coordinated charging of EVs `index` of a FleetState over its whole window.
+
+    leave, ret: leave/return steps of those EVs (len(index) x days); initial_soc: their
+    charge at step 0; arrival: their charge when plugging in after each day's trip
+    (len(index) x days). load is the aggregate of everything else (Wh per step), e.g.
+    base loads plus uncoordinated charging. Every session gets the energy the smart
+    charging rules would give it (charging.charge_step: full power, reduced power in
+    the reduced-power window without solar, until full) and valley_fill moves it to
+    the low points of its window, up to full power per step. Charging at solar
+    houses takes the panel output first, so the grid draw is the charge minus the
+    solar production of that step.
+
+    The schedules are written into fleet.consumption / ev_charge / ev_energy and the
+    EVs end with the charge of their last session. Returns (rows, steps, grid,
+    solar_ev): the house row, step and grid draw of every scheduled step, and the
+    estimated solar energy used per EV of the fleet (as GroupAccumulator.add_solar_ev,
+    zero for EVs without panels).
+    """
+    index = np.asarray(index, dtype=np.intp)
+    session_ev, start, stop, day = plug_windows(leave, ret, fleet.steps)
+    soc0 = np.where(day < 0, initial_soc[session_ev], arrival[session_ev, np.maximum(day, 0)])
+    ev = index[session_ev]
+    step_power = fleet.power[ev] * fleet.step_hours
+    length = stop - start
+    inside = np.arange(length.max(initial=0)) < length[:, None]
+    # energy of the session under the smart charging rules
+    reduced = fleet.axis.reduced_power[np.where(inside, start[:, None] + np.arange(inside.shape[1]), 0)]
+    reduced &= ~fleet.has_solar[fleet.ev_row[ev]][:, None]
+    rule_energy = (np.where(reduced, REDUCED_POWER_FACTOR, 1.0) * inside).sum(axis=1) * step_power
+    energy = np.clip(np.minimum(fleet.capacity[ev] - soc0, rule_energy), 0.0, None)
+    alloc, _ = valley_fill(load, start, stop, energy, step_power, batches)
+
+    session, offset = np.nonzero(inside)
+    charge = alloc[inside]
+    soc = (soc0[:, None] + np.cumsum(alloc, axis=1))[inside]
+    ev_flat = ev[session]
+    rows = fleet.ev_row[ev_flat]
+    steps = start[session] + offset
+    solar = fleet.solar_scale[rows] * fleet.solar_base[steps]
+    grid = charge - np.minimum(solar, charge)
+
+    # sessions of one EV never overlap, so (row, step) pairs are unique
+    fleet.consumption[rows, steps] += grid
+    fleet.ev_charge[rows, steps] = soc
+    fleet.ev_energy[ev_flat, steps] = charge
+    last = np.r_[session_ev[1:] != session_ev[:-1], True] if len(session_ev) else np.zeros(0, dtype=bool)
+    fleet.soc[ev[last]] = (soc0 + energy)[last]
+
+    used = np.where(fleet.has_solar[rows] & (soc < fleet.capacity[ev_flat]),
+                    np.minimum(solar, fleet.power[ev_flat] * fleet.step_hours), 0.0)
+    solar_ev = np.bincount(ev_flat, weights=used, minlength=len(fleet.soc))
+    return rows, steps, grid, solar_ev
@@ -1,22 +1,113 @@
-import pandas as pd
+import hashlib
+import os
+import numpy as np
 
-# Read CSV and let pandas use the first row as header
-data_solar_panel = pd.read_csv("Solar_data_year.csv")
+# yearly minute-level solar data (columns "time" and "Power(W)")
+SOLAR_CSV = "Solar_data_year.csv"
+# binary cache of the resampled series, next to the CSV
+CACHE_DIR_NAME = ".solar_cache"
+# time steps the minute-level data can be resampled to (divisors of an hour)
+STEP_MINUTES = (60, 30, 20, 15, 10, 5, 1)
 
-# print(data_solar_panel.head())
+# memory-mapped series already opened in this process, by cache key
+_loaded = {}
 
-# Convert the time column to datetime
-data_solar_panel["time"] = pd.to_datetime(data_solar_panel["time"])
 
-data_solar_panel.set_index("time", inplace=True)
-hourly_data_solar = data_solar_panel.resample("h").sum()
-hourly_data_solar = hourly_data_solar.reset_index()
-hourly_data_solar["Energy(Wh)"] = hourly_data_solar["Power(W)"]/60
+def _cache_key(path):
+    """Key of the CSV contents: absolute path, size and modification time."""
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
 
 
+def _cache_paths(path, key, step_minutes=60):
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    prefix = os.path.join(cache_dir, f"{stem}-{key}")
+    if step_minutes != 60:
+        prefix += f".{step_minutes}min"
+    return cache_dir, stem, prefix + ".time.npy", prefix + ".energy.npy"
+
+
+def _parse_csv(path, step_minutes=60):
+    """Parse the minute-level CSV and resample it to energy (Wh) per step of step_minutes."""
+    import pandas as pd
+
+    # Read CSV and let pandas use the first row as header
+    data_solar_panel = pd.read_csv(path)
+
+    # Convert the time column to datetime
+    data_solar_panel["time"] = pd.to_datetime(data_solar_panel["time"])
+
+    data_solar_panel.set_index("time", inplace=True)
+    # each minute at Power(W) is Power/60 Wh
+    steps = data_solar_panel.resample(f"{step_minutes}min").sum()
+    energy = (steps["Power(W)"] / 60).to_numpy(dtype=float)
+    time = steps.index.to_numpy(dtype="datetime64[ns]")
+    return time, energy
+
+
+def _write_atomic(path, array):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def load_solar(path=SOLAR_CSV, step_minutes=60):
+    """
+    Solar series resampled to steps of step_minutes as (time, energy_Wh) read-only
+    arrays.
+
+    The first call for a given CSV (path, size, mtime) and step parses it and writes
+    both series to .npy files in .solar_cache/ next to the CSV; later calls, in this
+    or any other process, memory-map those files without copying.
+    """
+    if step_minutes not in STEP_MINUTES:
+        raise ValueError(f"step_minutes must be one of {STEP_MINUTES}")
+    key = _cache_key(path)
+    if (key, step_minutes) in _loaded:
+        return _loaded[key, step_minutes]
+
+    cache_dir, stem, time_path, energy_path = _cache_paths(path, key, step_minutes)
+    if not (os.path.exists(time_path) and os.path.exists(energy_path)):
+        time, energy = _parse_csv(path, step_minutes)
+        os.makedirs(cache_dir, exist_ok=True)
+        # drop caches of older versions of the same CSV
+        for name in os.listdir(cache_dir):
+            if name.startswith(f"{stem}-") and not name.startswith(f"{stem}-{key}."):
+                os.remove(os.path.join(cache_dir, name))
+        _write_atomic(time_path, time)
+        _write_atomic(energy_path, energy)
+
+    series = (np.load(time_path, mmap_mode="r"), np.load(energy_path, mmap_mode="r"))
+    _loaded[key, step_minutes] = series
+    return series
+
+
+def load_hourly_solar(path=SOLAR_CSV):
+    """Hourly solar series as (time, energy_Wh) read-only arrays (see load_solar)."""
+    return load_solar(path, 60)
+
+
+def solar_energy_Wh(path=SOLAR_CSV, step_minutes=60):
+    """Solar energy (Wh) per step of the yearly data, memory-mapped (see load_solar)."""
+    return load_solar(path, step_minutes)[1]
+
+
+def __getattr__(name):
+    # hourly_data_solar used to be parsed at import time; now built on first access
+    if name == "hourly_data_solar":
+        import pandas as pd
+
+        time, energy = load_hourly_solar()
+        df = pd.DataFrame({"time": time, "Energy(Wh)": energy})
+        globals()["hourly_data_solar"] = df
+        return df
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Only execute these prints if run directly
 if __name__ == "__main__":
     print("Hourly Data (Solar):")
-    print(hourly_data_solar.head(100))
-    
\ No newline at end of file
+    print(__getattr__("hourly_data_solar").head(100))
@@ -0,0 +1,73 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from simulation import run_simulation
+
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+
+def _run_member(params, seed_seq):
+    """
+    One ensemble member in a worker process. Only numbers travel back:
+    the flat totals, the counts and the per-hour series (no house objects).
+    """
+    rng = np.random.default_rng(seed_seq)
+    res = run_simulation(**params, engine="columnar", rng=rng)
+    totals = {k: float(v) for k, v in res["totals"].items() if k != "counts"}
+    per_hour = {k: np.asarray(v) for k, v in res["per_hour"].items()}
+    return totals, res["totals"]["counts"], per_hour
+
+
+def _bands(samples, percentiles, axis=0):
+    """Mean, standard deviation and percentiles of samples along axis (runs)."""
+    stats = {
+        "mean": samples.mean(axis=axis),
+        "std": samples.std(axis=axis)
+    }
+    for p, value in zip(percentiles, np.percentile(samples, percentiles, axis=axis)):
+        stats[f"p{p:g}"] = value
+    return stats
+
+
+def run_ensemble(params, n_runs, workers=None, seed=42, percentiles=DEFAULT_PERCENTILES):
+    """
+    Monte Carlo ensemble of run_simulation.
+
+    params: keyword arguments for run_simulation (num_houses, num_solar, num_evs,
+    num_smart_evs, optionally hours). Each run gets its own numpy Generator from
+    SeedSequence(seed).spawn(n_runs), so runs never share random state and the
+    result is bit-identical for any number of workers. Runs are fanned out over a
+    process pool (workers=1 runs them in this process).
+
+    Returns dict with keys:
+      totals:   {metric: {"mean", "std", "p5", "p50", "p95"}} over runs
+      counts:   same statistics for the counts
+      per_hour: {series: {"mean", "std", "p5", ...}} with one value per hour
+      samples:  {metric: array of the n_runs per-run totals}
+      n_runs, seed
+    """
+    if n_runs < 1:
+        raise ValueError("n_runs must be >= 1")
+    children = np.random.SeedSequence(seed).spawn(n_runs)
+
+    if workers == 1:
+        members = [_run_member(params, child) for child in children]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map keeps run order, so the reduction below does not depend on scheduling
+            members = list(pool.map(_run_member, [params] * n_runs, children))
+
+    samples = {k: np.array([m[0][k] for m in members]) for k in members[0][0]}
+    count_samples = {k: np.array([m[1][k] for m in members], dtype=float) for k in members[0][1]}
+    per_hour = {
+        k: _bands(np.stack([m[2][k] for m in members]), percentiles)
+        for k in members[0][2]
+    }
+
+    return {
+        "totals": {k: _bands(v, percentiles) for k, v in samples.items()},
+        "counts": {k: _bands(v, percentiles) for k, v in count_samples.items()},
+        "per_hour": per_hour,
+        "samples": samples,
+        "n_runs": n_runs,
+        "seed": seed
+    }
@@ -0,0 +1,111 @@
+import gzip
+import numpy as np
+from timeaxis import time_index
+
+# per-house series in House.df order, and their names in the .npz bundle
+SERIES = ("energy_consumption_Wh", "solar_production_Wh", "ev_charge_Wh")
+CSV_COLUMNS = ("time",) + SERIES + ("house_id",)
+
+
+def house_matrices(houses):
+    """
+    houses x hours matrices of each per-house series, as a dict keyed by SERIES.
+    Houses of the columnar engine are read straight from their FleetState (no copy
+    when the houses are the fleet rows in order); DataFrame houses are stacked.
+    """
+    fleet = houses[0].fleet if houses else None
+    if fleet is not None and all(h.fleet is fleet for h in houses):
+        rows = np.array([h.row for h in houses], dtype=np.intp)
+        in_order = len(rows) == fleet.num_houses and (rows == np.arange(len(rows))).all()
+        matrices = {
+            "energy_consumption_Wh": fleet.consumption,
+            "solar_production_Wh": fleet.solar,
+            "ev_charge_Wh": fleet.ev_charge
+        }
+        return matrices if in_order else {name: m[rows] for name, m in matrices.items()}
+    return {name: np.array([h.df[name].to_numpy() for h in houses], dtype=float).reshape(len(houses), -1)
+            for name in SERIES}
+
+
+def house_table(houses):
+    """Metadata of every house: id, has_solar and ev_type ("" for houses without an EV)."""
+    return {
+        "house_id": np.array([h.house_id for h in houses], dtype=np.int64),
+        "has_solar": np.array([h.has_solar for h in houses], dtype=bool),
+        "ev_type": np.array([h.ev_type or "" for h in houses], dtype="U9")
+    }
+
+
+def _time(houses, hours):
+    if houses:
+        return houses[0].axis.time
+    return time_index(hours)
+
+
+def export_npz(res, file, dtype=np.float64):
+    """
+    Write every house's hourly series of a run_simulation result to one compressed
+    .npz bundle (file: path or binary file object).
+
+    The bundle holds the houses x hours matrices named as in SERIES, the shared time
+    index, the house metadata table (house_id, has_solar, ev_type) and the totals.
+    Load it with np.load; nothing in it needs pickle. dtype=np.float32 halves the
+    size at the cost of precision.
+    """
+    houses = res["houses"]
+    matrices = house_matrices(houses)
+    hours = next(iter(matrices.values())).shape[1] if houses else 0
+    arrays = {name: m.astype(dtype, copy=False) for name, m in matrices.items()}
+    arrays["time"] = np.asarray(_time(houses, hours))
+    arrays.update(house_table(houses))
+    arrays.update({f"totals_{k}": np.float64(v) for k, v in res["totals"].items() if k != "counts"})
+    arrays.update({f"counts_{k}": np.int64(v) for k, v in res["totals"]["counts"].items()})
+    np.savez_compressed(file, **arrays)
+
+
+def iter_csv(res, chunk_houses=256):
+    """
+    Long-format CSV of every house's hourly series (the columns of House.df plus
+    house_id, as the app's old concatenated download) as text chunks of
+    chunk_houses houses each, so the whole file never has to exist as one string.
+    """
+    import pandas as pd
+
+    houses = res["houses"]
+    yield ",".join(CSV_COLUMNS) + "\n"
+    if not houses:
+        return
+    matrices = house_matrices(houses)
+    hours = matrices[SERIES[0]].shape[1]
+    time = pd.DatetimeIndex(_time(houses, hours))
+    ids = house_table(houses)["house_id"]
+    for start in range(0, len(houses), chunk_houses):
+        stop = min(start + chunk_houses, len(houses))
+        n = stop - start
+        chunk = pd.DataFrame({"time": np.tile(time, n)})
+        for name in SERIES:
+            chunk[name] = matrices[name][start:stop].ravel()
+        chunk["house_id"] = np.repeat(ids[start:stop], hours)
+        yield chunk.to_csv(index=False, header=False)
+
+
+def write_csv(res, file, chunk_houses=256):
+    """
+    Write the long-format CSV of iter_csv to file (path or text file object); a path
+    ending in .gz is gzip-compressed.
+    """
+    if isinstance(file, str):
+        with (gzip.open if file.endswith(".gz") else open)(file, "wt", newline="") as f:
+            return write_csv(res, f, chunk_houses)
+    for text in iter_csv(res, chunk_houses):
+        file.write(text)
+
+
+def export_houses(res, path):
+    """Per-house export by extension: .npz (compressed bundle), .csv or .csv.gz (streamed)."""
+    if path.endswith(".npz"):
+        export_npz(res, path)
+    elif path.endswith((".csv", ".csv.gz")):
+        write_csv(res, path)
+    else:
+        raise ValueError(f"unsupported export format: {path} (use .npz, .csv or .csv.gz)")
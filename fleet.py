@@ -0,0 +1,251 @@
+import numpy as np
+from charging import charge_step
+from timeaxis import time_axis, DEFAULT_TARIFF
+from trips import presence_matrix
+from scheduler import EventSchedule
+
+
+class FleetState:
+    """
+    Array-backed state store for a whole neighbourhood.
+
+    Holds one houses x steps matrix each for consumption and EV state of charge,
+    plus one entry per EV for its charging state. Solar production is not stored per
+    house: every solar house shares one read-only base profile (solar_base) and has
+    its own panel scale (solar_scale, 0 without panels), and production is computed
+    from the two where it is needed. House and Car objects created with ``fleet=``
+    are thin views into rows of these arrays, so the simulation writes numbers into
+    NumPy instead of into per-house DataFrames.
+
+    dtype is the type of the houses x steps and EVs x steps matrices: float64, or
+    float32 for the compact engine (half the memory; integer Wh base loads and
+    charges stay exact, other values are rounded to about 7 digits). Per-EV state
+    and the aggregates stay float64.
+
+    A step is one hour by default; with step_minutes < 60 every hour has
+    steps_per_hour columns, energies are per step and the "hour" arguments of the
+    methods are step indices. `hours` always counts real hours.
+    """
+
+    def __init__(self, num_houses, num_evs=0, hours=168, start="2023-08-31", step_minutes=60, tariff=DEFAULT_TARIFF,
+                 dtype=np.float64):
+        if step_minutes <= 0 or 60 % step_minutes != 0:
+            raise ValueError("step_minutes must divide 60")
+        self.num_houses = num_houses
+        self.hours = hours
+        self.step_minutes = step_minutes
+        self.steps_per_hour = 60 // step_minutes
+        # length of a step in hours: power (W) times step_hours is energy per step (Wh)
+        self.step_hours = step_minutes / 60
+        self.steps = hours * self.steps_per_hour
+        self.start = np.datetime64(start, "h")
+        self.tariff = tariff
+        self.dtype = np.dtype(dtype)
+        # hour of the run at which the matrices start (non-zero in chunked runs)
+        self.offset = 0
+        # one shared calendar (time index, hour of day, peak / reduced-power masks,
+        # prices) for every house
+        self._set_axis(time_axis(hours, self.start, step_minutes, tariff))
+
+        # houses x steps matrices (Wh per step)
+        self.consumption = np.zeros((num_houses, self.steps), dtype=self.dtype)
+        self.ev_charge = np.full((num_houses, self.steps), np.nan, dtype=self.dtype)
+        self.has_solar = np.zeros(num_houses, dtype=bool)
+        # solar production of house r at step s is solar_scale[r] * solar_base[s]
+        self.solar_base = np.zeros(self.steps)
+        self.solar_scale = np.zeros(num_houses)
+
+        # per-EV state, indexed by car position (car_id - 1)
+        self.ev_row = np.zeros(num_evs, dtype=np.intp)  # house row of each EV
+        self.capacity = np.zeros(num_evs)
+        self.power = np.zeros(num_evs)
+        self.smart = np.zeros(num_evs, dtype=bool)
+        self.soc = np.zeros(num_evs)
+        self.connected = np.ones(num_evs, dtype=bool)
+        # energy charged into each EV per step (Wh, EVs x steps), for the energy balance
+        self.ev_energy = np.zeros((num_evs, self.steps), dtype=self.dtype)
+        # EVs charged by a precomputed schedule (coordination.schedule_fleet); they
+        # plug in and out as usual but never join the active set
+        self.scheduled = np.zeros(num_evs, dtype=bool)
+        # sorted positions of the EVs that are plugged in and not full; built from
+        # connected / soc by the first charge_hour, then kept up to date by plug,
+        # unplug and charge_hour so an hour only touches the cars that can charge
+        self.active = None
+
+    def load_window(self, offset, hours, consumption=None):
+        """
+        Start a new window of `hours` hours at hour `offset` of the run (chunked runs).
+        The houses x hours matrices are replaced by fresh ones; per-EV state
+        (charge, connection) carries over. Hour arguments stay window-local.
+        consumption (houses x steps, e.g. the window's base load) is used as the
+        new consumption matrix instead of zeros.
+        """
+        self.offset = offset
+        self.hours = hours
+        self.steps = hours * self.steps_per_hour
+        self._set_axis(time_axis(hours, self.start + np.timedelta64(offset, "h"), self.step_minutes, self.tariff))
+        if consumption is None:
+            self.consumption = np.zeros((self.num_houses, self.steps), dtype=self.dtype)
+        else:
+            self.consumption = np.asarray(consumption, dtype=self.dtype)
+        self.ev_charge = np.full((self.num_houses, self.steps), np.nan, dtype=self.dtype)
+        self.ev_energy = np.zeros((len(self.soc), self.steps), dtype=self.dtype)
+        self.solar_base = np.zeros(self.steps)
+
+    def _set_axis(self, axis):
+        self.axis = axis
+        self.time = axis.time
+        self.hour_of_day = axis.hour_of_day
+
+    def set_base_load(self, rows, hourly_Wh):
+        """
+        Household base load of houses rows from hourly energy (Wh per hour); with
+        sub-hourly steps each hour's energy is spread evenly over its steps.
+        """
+        if self.steps_per_hour == 1:
+            self.consumption[rows] = hourly_Wh
+        else:
+            self.consumption[rows] = np.repeat(np.asarray(hourly_Wh, dtype=float) / self.steps_per_hour,
+                                               self.steps_per_hour, axis=-1)
+
+    def set_solar(self, rows, base_Wh, scale=1.0):
+        """
+        Give houses `rows` solar panels: production is scale (per row, or one value)
+        times base_Wh, the shared profile (Wh per step) of this window. The profile is
+        kept by reference as a read-only array, not copied per house.
+        """
+        base = np.asarray(base_Wh, dtype=float)
+        if base.shape != (self.steps,):
+            raise ValueError(f"solar base profile must have {self.steps} values (one per step)")
+        base = base.view()
+        base.setflags(write=False)
+        self.solar_base = base
+        self.has_solar[rows] = True
+        self.solar_scale[rows] = scale
+
+    def solar_at(self, rows, hour):
+        """Solar production (Wh) of houses rows at one hour."""
+        return self.solar_scale[rows] * self.solar_base[hour]
+
+    def solar_rows(self, rows):
+        """Solar production of houses rows as a len(rows) x steps matrix."""
+        return self.solar_scale[rows, None] * self.solar_base
+
+    @property
+    def solar(self):
+        """Solar production of every house (houses x steps), built on access (exports, frames)."""
+        return np.outer(self.solar_scale, self.solar_base)
+
+    def solar_production(self, mask=None):
+        """Production per step summed over the houses in mask (default all houses)."""
+        scale = self.solar_scale if mask is None else self.solar_scale[mask]
+        return scale.sum() * self.solar_base
+
+    def register_ev(self, index, row, capacity, power, smart):
+        """Record the fixed parameters of EV `index`, parked at house row `row`."""
+        self.ev_row[index] = row
+        self.capacity[index] = capacity
+        # charging power in W; charge_hour turns it into energy per step
+        self.power[index] = power
+        self.smart[index] = smart
+
+    def register_evs(self, rows, capacity, power, smart, soc=None):
+        """
+        register_ev for every EV at once: EV i parked at house rows[i] (capacity,
+        power and smart per EV or one value for all). With soc, the EVs start with
+        that charge and fill_ev_charge sets their houses' ev_charge to it.
+        """
+        self.ev_row[:] = rows
+        self.capacity[:] = capacity
+        self.power[:] = power
+        self.smart[:] = smart
+        if soc is not None:
+            self.soc[:] = soc
+            self.fill_ev_charge(self.soc)
+
+    def fill_ev_charge(self, charge_Wh):
+        """
+        Set the ev_charge series of every EV's house to that EV's charge_Wh for the
+        whole window, as House.assign_ev does with the car's current charge.
+        """
+        self.ev_charge[self.ev_row] = np.asarray(charge_Wh)[:, None]
+
+    def mark_away(self, present):
+        """Set ev_charge to NaN wherever present (EVs x hours, trips.presence_matrix) is False."""
+        rows = self.ev_row
+        self.ev_charge[rows] = np.where(present, self.ev_charge[rows], np.nan)
+
+    def schedule_trips(self, leave, ret):
+        """
+        Mark the steps every EV is away (leave / return steps as EVs x days arrays,
+        trips.sample_trips) and return the EventSchedule of their plug/unplug events
+        in this window.
+        """
+        self.mark_away(presence_matrix(leave, ret, self.steps))
+        return EventSchedule(leave, ret, self.steps)
+
+    def unplug(self, index, hour):
+        """Same as Car.unplug for EV `index` (a position or an array of positions)."""
+        self.connected[index] = False
+        self.ev_charge[self.ev_row[index], hour] = np.nan
+        if self.active is not None:
+            self.active = self.active[~np.isin(self.active, index)]
+
+    def plug(self, index, hour, charge_Wh):
+        """EV `index` (position or array) comes home at `hour` with charge_Wh in the battery (Car.plug)."""
+        self.soc[index] = charge_Wh
+        self.connected[index] = True
+        self.ev_charge[self.ev_row[index], hour] = charge_Wh
+        if self.active is not None:
+            index = np.atleast_1d(index)
+            self.active = np.union1d(self.active, index[(self.soc[index] < self.capacity[index]) & ~self.scheduled[index]])
+
+    def step(self, hour, schedule, arrival_of):
+        """
+        One step of the charging loop: the EVs of schedule (an EventSchedule) leaving
+        at `hour` unplug, those coming home plug in with arrival_of(plugged, day) Wh
+        (plugged: EV positions, day: the day of each trip), then charge_hour.
+        Returns charge_hour's (rows, grid_Wh).
+        """
+        unplugged, plugged, day = schedule.split(hour)
+        if len(unplugged):
+            self.unplug(unplugged, hour)
+        if len(plugged):
+            self.plug(plugged, hour, arrival_of(plugged, day))
+        return self.charge_hour(hour)
+
+    def charge_hour(self, hour):
+        """
+        Charge every connected, not-full EV for one step with the batched kernel.
+        Same effect as calling Car.charge and updating current_charge / ev_charge_Wh per car.
+        Only the active set is touched; cars that fill up leave it.
+        Returns (rows, grid_Wh): the house rows that charged and their grid draw.
+        """
+        if self.active is None:
+            self.active = np.flatnonzero(self.connected & (self.soc < self.capacity) & ~self.scheduled)
+        idx = self.active
+        if not len(idx):
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        rows = self.ev_row[idx]
+        charge, grid = charge_step(
+            self.soc[idx], self.capacity[idx], self.power[idx] * self.step_hours, self.smart[idx],
+            self.has_solar[rows], True, self.solar_at(rows, hour), self.axis.reduced_power[hour]
+        )
+        # one EV per house, so rows are unique
+        self.consumption[rows, hour] += grid
+        self.ev_energy[idx, hour] = charge
+        self.soc[idx] = np.minimum(self.capacity[idx], self.soc[idx] + charge)
+        self.ev_charge[rows, hour] = self.soc[idx]
+        self.active = idx[self.soc[idx] < self.capacity[idx]]
+        return rows, grid
+
+    def frame(self, row):
+        """Build the per-house DataFrame (same columns as House.df) for one row on demand."""
+        import pandas as pd
+
+        return pd.DataFrame({
+            "time": self.time,
+            "energy_consumption_Wh": self.consumption[row].copy(),
+            "solar_production_Wh": self.solar_scale[row] * self.solar_base,
+            "ev_charge_Wh": self.ev_charge[row].copy()
+        })
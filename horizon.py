@@ -0,0 +1,254 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import numpy as np
+from house import base_load_profiles, draw_margins
+from fleet import FleetState
+from solar import panel_scale, resolve_panel_kwp
+from aggregate import CONSUMPTION_GROUPS
+from timeaxis import DEFAULT_TARIFF, Tariff
+from trips import sample_trips
+from car import EV_CAPACITY_WH, EV_POWER_W
+from checkpoint import CheckpointWriter, read_checkpoint, rng_state, restore_rng
+from simulation import (
+    aligned_solar_profile, solar_start,
+    group_masks, per_hour_sums, solar_ev_energy, build_totals
+)
+
+# order of the per-hour series in results and in the streamed output file
+PER_HOUR_SERIES = ("all", "smart", "non_smart", "no_ev", "solar_houses", "non_solar", "solar_production")
+
+
+def run_horizon(num_houses, num_solar, num_evs, num_smart_evs, hours=8760, chunk_hours=168, seed=42, rng=None, out=None,
+                panel_kwp=None, panel_multiplier=None, tariff=DEFAULT_TARIFF, checkpoint=None, checkpoint_hours=None):
+    """
+    Run the simulation over a long horizon (up to the full year of solar data) in
+    chunks of chunk_hours hours, with memory bounded by one chunk. The time axis
+    starts at the first timestamp of the solar data, like the solar series.
+
+    Only one chunk of houses x hours matrices exists at a time; EV charge and
+    connection state carry over between chunks. Per-hour aggregates are written to
+    `out` (CSV path) as each chunk finishes; without `out` they are returned in
+    per_hour (groups x hours, independent of the number of houses).
+    Random draws come from rng (default np.random.default_rng(seed)), so results are
+    statistically equivalent to, not the same numbers as, run_simulation.
+    panel_kwp / panel_multiplier size the solar installations as in run_simulation.
+
+    With checkpoint (a file path) the run state is saved every checkpoint_hours hours
+    (a multiple of chunk_hours, default every chunk) and after the last chunk, and
+    resume_horizon continues from the last saved state. Checkpoints fall between
+    chunks, where no houses x hours matrix is alive and no plug/unplug event is
+    pending (trips are drawn per chunk and end the same day), so the state is the
+    EVs' charge and connection, the Generator state and the partial aggregates. They
+    are appended to the file by a background thread (checkpoint.CheckpointWriter).
+    Returns dict with keys: totals, per_hour (None when out is given), hours, cost
+    (energy cost per consumption group under tariff)
+    """
+    if chunk_hours <= 0 or chunk_hours % 24 != 0:
+        raise ValueError("chunk_hours must be a positive multiple of 24")
+    if checkpoint_hours is None:
+        checkpoint_hours = chunk_hours
+    elif checkpoint_hours <= 0 or checkpoint_hours % chunk_hours != 0:
+        raise ValueError("checkpoint_hours must be a positive multiple of chunk_hours")
+    if rng is None:
+        rng = np.random.default_rng(seed)
+    # fail before drawing anything if the horizon is longer than the solar data
+    aligned_solar_profile(hours)
+
+    # houses keep their daily margin, solar panels and EVs for the whole run
+    margins = draw_margins(num_houses, rng)
+    solar_rows = rng.choice(num_houses, num_solar, replace=False) if num_solar > 0 else np.empty(0, dtype=np.intp)
+    scales = panel_scale(num_solar, resolve_panel_kwp(panel_kwp, num_solar, rng), panel_multiplier)
+    ev_rows = rng.choice(num_houses, num_evs, replace=False) if num_evs > 0 else np.empty(0, dtype=np.intp)
+    initial_charge = rng.integers(1000, 60000, size=num_evs)
+
+    run = {"num_houses": num_houses, "num_solar": num_solar, "num_evs": num_evs, "num_smart_evs": num_smart_evs,
+           "hours": hours, "chunk_hours": chunk_hours, "checkpoint_hours": checkpoint_hours,
+           "tariff": {"bands": tariff.bands, "default": tariff.default}, "streamed": out is not None}
+    fixed = {"margins": margins, "solar_rows": solar_rows, "scales": scales, "ev_rows": ev_rows,
+             "initial_charge": initial_charge}
+    state, ev_state = _start_state(initial_charge)
+
+    writer = None
+    if checkpoint is not None:
+        # the Generator state after the draws above lets a resume start at hour 0
+        writer = CheckpointWriter(checkpoint, head=(dict(run, rng=rng_state(rng)), fixed))
+    return _run_chunks(run, fixed, state, ev_state, rng, [], out, writer, tariff)
+
+
+def resume_horizon(checkpoint, out=None):
+    """
+    Continue a run_horizon run from the last complete state in its checkpoint file.
+
+    out must be the CSV file of the interrupted run if it streamed one (lines past
+    the checkpoint are dropped and rewritten) and None otherwise. The run keeps
+    checkpointing into the same file. The results are the same, bit for bit, as
+    those of the run without the interruption.
+    """
+    (run, fixed), states, end = read_checkpoint(checkpoint)
+    if run["streamed"] != (out is not None):
+        raise ValueError("out must be given exactly when the checkpointed run streamed its per-hour series")
+    tariff = Tariff(run["tariff"]["bands"], run["tariff"]["default"])
+    kept = [{name: arrays[f"per_hour_{name}"] for name in PER_HOUR_SERIES} for _, arrays in states
+            if not run["streamed"]]
+    if states:
+        state, arrays = states[-1]
+        rng = restore_rng(state.pop("rng"))
+        ev_state = {name: arrays[name] for name in ("soc", "connected", "solar_ev")}
+    else:
+        rng = restore_rng(run["rng"])
+        state, ev_state = _start_state(fixed["initial_charge"])
+    writer = CheckpointWriter(checkpoint, end=end)
+    return _run_chunks(run, fixed, state, ev_state, rng, kept, out, writer, tariff)
+
+
+def _start_state(initial_charge):
+    """Run state at hour 0: empty aggregates, every EV plugged in at its initial charge."""
+    state = {"offset": 0, "sums": {name: 0.0 for name in PER_HOUR_SERIES},
+             "peak_sums": {"all": 0.0, "smart": 0.0, "non_smart": 0.0},
+             "cost": {name: 0.0 for name in CONSUMPTION_GROUPS}, "out_bytes": None}
+    ev_state = {"soc": initial_charge.astype(float), "connected": np.ones(len(initial_charge), dtype=bool),
+                "solar_ev": np.zeros(len(initial_charge))}
+    return state, ev_state
+
+
+def _run_chunks(run, fixed, state, ev_state, rng, kept, out, writer, tariff):
+    """
+    The chunk loop of run_horizon from hour state["offset"] on. kept holds the
+    per-hour series of the chunks already done (not streamed runs).
+    """
+    num_houses, num_evs, hours, chunk_hours = run["num_houses"], run["num_evs"], run["hours"], run["chunk_hours"]
+    solar_rows, scales, ev_rows = fixed["solar_rows"], fixed["scales"], fixed["ev_rows"]
+    margins, initial_charge = fixed["margins"], fixed["initial_charge"]
+    aligned_solar = aligned_solar_profile(hours)
+    # the calendar of the solar data, so the months of the output are the data's months
+    fleet = FleetState(num_houses, num_evs, hours=min(chunk_hours, hours), start=solar_start(), tariff=tariff)
+    fleet.has_solar[solar_rows] = True
+    fleet.register_evs(ev_rows, EV_CAPACITY_WH, EV_POWER_W, np.arange(num_evs) < run["num_smart_evs"], ev_state["soc"])
+    fleet.connected[:] = ev_state["connected"]
+    solar_ev = np.array(ev_state["solar_ev"], dtype=float)
+    # charge when coming home: 10-40% of capacity, one draw per plug event
+    low, high = int(0.10 * EV_CAPACITY_WH), int(0.40 * EV_CAPACITY_WH)
+    arrival_of = lambda plugged, day: rng.integers(low, high + 1, size=len(plugged))
+
+    masks = group_masks(fleet.has_solar, fleet.ev_row, fleet.smart)
+    sums, peak_sums, cost = state["sums"], state["peak_sums"], state["cost"]
+    # kept[:saved] are already in the checkpoint file
+    saved = len(kept)
+
+    out_file = writer_csv = None
+    if out is not None:
+        if state["out_bytes"] is None:
+            out_file = open(out, "w", newline="")
+            writer_csv = csv.writer(out_file)
+            writer_csv.writerow(("hour", "time") + PER_HOUR_SERIES)
+        else:
+            # drop the lines written after the checkpoint
+            with open(out, "r+b") as f:
+                f.truncate(state["out_bytes"])
+            out_file = open(out, "a", newline="")
+            writer_csv = csv.writer(out_file)
+
+    try:
+        for offset in range(state["offset"], hours, chunk_hours):
+            n = min(chunk_hours, hours - offset)
+            fleet.load_window(offset, n, consumption=base_load_profiles(num_houses, rng, n, margins=margins))
+            fleet.set_solar(solar_rows, aligned_solar[offset:offset + n], scales)
+            fleet.fill_ev_charge(initial_charge)
+
+            # trips for the days of this chunk, in window-local hours
+            leave, ret = sample_trips(num_evs, -(-n // 24), rng, first_day=offset // 24)
+            leave -= offset
+            ret -= offset
+            schedule = fleet.schedule_trips(leave, ret)
+
+            for hour in range(n):
+                fleet.step(hour, schedule, arrival_of)
+
+            # aggregate the chunk, then drop it
+            per_hour = per_hour_sums(fleet.consumption, fleet.solar_production(), masks)
+            peak_mask = fleet.axis.peak
+            for name in PER_HOUR_SERIES:
+                sums[name] += per_hour[name].sum()
+            for name in peak_sums:
+                peak_sums[name] += per_hour[name][peak_mask].sum()
+            for name in cost:
+                cost[name] += float(fleet.axis.cost(per_hour[name]))
+            solar_ev += solar_ev_energy(fleet.ev_charge[ev_rows], fleet.solar_rows(ev_rows), fleet.capacity, fleet.power)
+
+            if writer_csv is not None:
+                columns = np.column_stack([per_hour[name] for name in PER_HOUR_SERIES])
+                times = np.char.replace(np.datetime_as_string(fleet.time, unit="m"), "T", " ")
+                writer_csv.writerows(
+                    (offset + h, times[h], *columns[h].tolist()) for h in range(n)
+                )
+                out_file.flush()
+            else:
+                kept.append(per_hour)
+
+            end = offset + n
+            if writer is not None and (end % run["checkpoint_hours"] == 0 or end == hours):
+                arrays = {"soc": fleet.soc.copy(), "connected": fleet.connected.copy(), "solar_ev": solar_ev.copy()}
+                # only the per-hour series since the previous checkpoint
+                if kept[saved:]:
+                    arrays.update({f"per_hour_{name}": np.concatenate([chunk[name] for chunk in kept[saved:]])
+                                   for name in PER_HOUR_SERIES})
+                    saved = len(kept)
+                writer.write({"offset": end, "rng": rng_state(rng), "sums": dict(sums), "peak_sums": dict(peak_sums),
+                              "cost": dict(cost), "out_bytes": os.fstat(out_file.fileno()).st_size if out_file is not None else None},
+                             arrays)
+    finally:
+        if out_file is not None:
+            out_file.close()
+        if writer is not None:
+            writer.close()
+
+    # solar used by smart EVs in solar houses that are plugged in at the end (match model.py)
+    counted = fleet.smart & fleet.has_solar[fleet.ev_row] & fleet.connected
+    totals = build_totals(sums, peak_sums, masks, solar_ev[counted].sum(), counted.sum())
+
+    per_hour = None
+    if writer_csv is None:
+        per_hour = {name: np.concatenate([chunk[name] for chunk in kept]) for name in PER_HOUR_SERIES}
+
+    return {"totals": totals, "per_hour": per_hour, "hours": hours, "cost": cost}
+
+
+def main(argv=None):
+    """
+    python horizon.py --houses N ... --checkpoint run.ckpt [--out per_hour.csv]
+    python horizon.py --resume run.ckpt [--out per_hour.csv]
+    Prints the totals as JSON.
+    """
+    parser = argparse.ArgumentParser(prog="python horizon.py", description="Long-horizon run in chunks, with checkpoints.")
+    parser.add_argument("--houses", type=int, help="number of houses (>= 1)")
+    parser.add_argument("--solar", type=int, default=0, help="number of solar houses")
+    parser.add_argument("--evs", type=int, default=0, help="number of EVs")
+    parser.add_argument("--smart", type=int, default=0, help="number of smart EVs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--hours", type=int, default=8760, help="simulated hours (default one year)")
+    parser.add_argument("--chunk", type=int, default=168, metavar="HOURS", help="hours per chunk (multiple of 24)")
+    parser.add_argument("--out", help="stream the per-hour series to this CSV file")
+    parser.add_argument("--checkpoint", metavar="PATH", help="save the run state to this file")
+    parser.add_argument("--checkpoint-hours", type=int, metavar="HOURS", help="hours between checkpoints (default every chunk)")
+    parser.add_argument("--resume", metavar="PATH", help="continue the run checkpointed in this file")
+    args = parser.parse_args(argv)
+
+    if args.resume:
+        res = resume_horizon(args.resume, out=args.out)
+    elif args.houses is None or args.houses < 1:
+        parser.error("--houses (>= 1) or --resume is required")
+    else:
+        res = run_horizon(args.houses, args.solar, args.evs, args.smart, hours=args.hours, chunk_hours=args.chunk,
+                          seed=args.seed, out=args.out, checkpoint=args.checkpoint, checkpoint_hours=args.checkpoint_hours)
+    totals = {k: float(v) for k, v in res["totals"].items() if k != "counts"}
+    totals["counts"] = {k: int(v) for k, v in res["totals"]["counts"].items()}
+    json.dump(totals, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
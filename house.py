@@ -1,54 +1,208 @@
-import pandas as pd
 import numpy as np
+from timeaxis import time_axis
+
+# Daily energy target (Wh) before the per-house margin
+BASE_DAILY_WH = 6630.0
+# random margin per house between -2% and +5%
+DAILY_MARGIN = (-0.02, 0.05)
+# sigma of the lognormal hourly noise
+NOISE_SIGMA = 0.12
+# minimum hourly baseline so no hour is 0 (Wh)
+MIN_BASELINE_WH = 20.0
+
+
+def _diurnal_fractions():
+    """Per-hour fraction of the daily energy for a single day (24 values summing to 1)."""
+    # Build a 24-hour diurnal weight: evening peak + smaller morning peak + baseline
+    evening_peak = np.exp(-0.5 * ((np.arange(24) - 19) / 2.5) ** 2)    # peak around 19:00
+    morning_peak = 0.5 * np.exp(-0.5 * ((np.arange(24) - 8) / 1.8) ** 2)  # smaller peak ~08:00
+    baseline = 0.25 * np.ones(24)  # ensures no hour is zero
+    weights24 = baseline + evening_peak + morning_peak
+    return weights24 / weights24.sum()
+
+
+DIURNAL_FRACTIONS = _diurnal_fractions()
+DIURNAL_FRACTIONS.setflags(write=False)
+
+
+def draw_margins(n, rng):
+    """Per-house daily margin (between -2% and +5%) for n houses."""
+    return rng.uniform(*DAILY_MARGIN, size=n)
+
+
+def base_load_profiles(n, rng=None, hours=168, margins=None):
+    """
+    Household base load for n houses at once, as an n x hours matrix (Wh) starting at
+    midnight. Same profile as House.__init__ (daily target with -2%/+5% margin,
+    lognormal noise, 20 Wh floor, integer rounding), but all margins and all n*hours
+    noise samples are drawn in one vectorized call each from rng (a numpy Generator).
+    Pass margins (from draw_margins) to keep the same houses across chunks of a run.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if margins is None:
+        margins = draw_margins(n, rng)
+    daily_target = BASE_DAILY_WH * (1.0 + margins)
+    hourly_frac = np.resize(DIURNAL_FRACTIONS, hours)
+    noise = rng.lognormal(mean=0.0, sigma=NOISE_SIGMA, size=(n, hours))
+    # hourly base (Wh) times noise, in place to keep a single n x hours buffer
+    noise *= hourly_frac
+    noise *= daily_target[:, None]
+    np.maximum(noise, MIN_BASELINE_WH, out=noise)
+    return np.round(noise, out=noise)
+
 
 class House:
-    def __init__(self, house_id, has_solar=False, ev = None, ev_type=None):
+    # fixed attributes instead of a per-instance __dict__ (a 100k-house run keeps 100k of these)
+    __slots__ = ("house_id", "has_solar", "ev", "ev_type", "fleet", "row", "accumulator", "axis", "_df")
+
+    # number of cell/column writes into DataFrame-backed houses (for run profiles)
+    df_writes = 0
+
+    def __init__(self, house_id, has_solar=False, ev = None, ev_type=None, fleet=None, row=None, base_load_Wh=None, hours=168,
+                 start="2023-08-31"):
         self.house_id = house_id
         self.has_solar = has_solar
         self.ev = ev
         self.ev_type = ev_type
+        # When a FleetState is given, this house is a view into row `row` of its matrices
+        self.fleet = fleet
+        self.row = row
+        # optional aggregate.GroupAccumulator told about every consumption change
+        self.accumulator = None
         
-        # Create hourly timestamps for one week (168 hours)
-        hours = pd.date_range("2023-08-31", periods=168, freq="h")
-        hod = hours.hour.values  # 0..23 repeated
-
-        # Daily energy target (Wh) with a small random margin per house
-        base_daily_Wh = 6630.0
-        # small random margin between -2% and +5%
-        margin = np.random.uniform(-0.02, 0.05)
-        daily_target = base_daily_Wh * (1.0 + margin)
-
-        # Build a 24-hour diurnal weight: evening peak + smaller morning peak + baseline
-        evening_peak = np.exp(-0.5 * ((np.arange(24) - 19) / 2.5) ** 2)    # peak around 19:00
-        morning_peak = 0.5 * np.exp(-0.5 * ((np.arange(24) - 8) / 1.8) ** 2)  # smaller peak ~08:00
-        baseline = 0.25 * np.ones(24)  # ensures no hour is zero
-        weights24 = baseline + evening_peak + morning_peak
-        # per-hour fraction for a single day
-        frac24 = weights24 / weights24.sum()
-
-        # Tile for 7 days to get 168 hourly fractions
-        hourly_frac = np.tile(frac24, 7)
-
-        # Hourly deterministic values (Wh) before noise
-        hourly_base_Wh = hourly_frac * daily_target
-
-        # Multiply by lognormal noise (positively skewed), small sigma for modest variability
-        noise = np.random.lognormal(mean=0.0, sigma=0.12, size=168)
-        hourly_with_noise = hourly_base_Wh * noise
-
-        # Enforce a small minimum baseline so no hour is 0 (e.g., 20 Wh)
-        min_baseline_Wh = 20.0
-        hourly_final = np.maximum(hourly_with_noise, min_baseline_Wh)
-
-        # Round to integers (Wh)
-        hourly_final = np.round(hourly_final).astype(float)
-
-        self.df = pd.DataFrame({
-            "time": hours,
-            "energy_consumption_Wh": hourly_final,
-            "solar_production_Wh": 0.0,
-            "ev_charge_Wh": np.nan            
-        })
+        # Hourly timestamps (one week = 168 hours by default) and their calendar lookups
+        if fleet is not None:
+            hours = fleet.hours
+        self.axis = fleet.axis if fleet is not None else time_axis(hours, start)
+        time = self.axis.time
+
+        if base_load_Wh is not None:
+            # profile already drawn (House.batch)
+            hourly_final = base_load_Wh
+        else:
+            # Daily energy target (Wh) with a small random margin per house
+            margin = np.random.uniform(*DAILY_MARGIN)
+            daily_target = BASE_DAILY_WH * (1.0 + margin)
+
+            # Repeat the single-day fractions (7 days -> 168 hourly fractions)
+            hourly_frac = np.resize(DIURNAL_FRACTIONS, hours)
+
+            # Hourly deterministic values (Wh) before noise
+            hourly_base_Wh = hourly_frac * daily_target
+
+            # Multiply by lognormal noise (positively skewed), small sigma for modest variability
+            noise = np.random.lognormal(mean=0.0, sigma=NOISE_SIGMA, size=hours)
+            hourly_with_noise = hourly_base_Wh * noise
+
+            # Enforce a small minimum baseline so no hour is 0 (e.g., 20 Wh)
+            hourly_final = np.maximum(hourly_with_noise, MIN_BASELINE_WH)
+
+            # Round to integers (Wh)
+            hourly_final = np.round(hourly_final).astype(float)
+
+        if fleet is not None:
+            fleet.set_base_load(row, hourly_final)
+            fleet.has_solar[row] = has_solar
+            self._df = None
+        else:
+            # pandas is only needed by DataFrame-backed houses
+            import pandas as pd
+
+            self._df = pd.DataFrame({
+                "time": time,
+                "energy_consumption_Wh": np.array(hourly_final, dtype=float),
+                "solar_production_Wh": 0.0,
+                "ev_charge_Wh": np.nan            
+            })
+
+    @classmethod
+    def batch(cls, n, rng=None, fleet=None, start_id=1, hours=168, start="2023-08-31"):
+        """
+        Build n houses at once with base_load_profiles (one vectorized draw from rng).
+        With a FleetState the houses are views into its rows 0..n-1; otherwise each
+        gets its own DataFrame sharing one time index.
+        """
+        if fleet is not None:
+            hours = fleet.hours
+        profiles = base_load_profiles(n, rng, hours)
+        if fleet is not None:
+            fleet.set_base_load(slice(0, n), profiles)
+        return [
+            cls(house_id=start_id + row, fleet=fleet, row=row, base_load_Wh=profiles[row], hours=hours,
+                start=start)
+            for row in range(n)
+        ]
+
+    @property
+    def df(self):
+        """Hourly DataFrame of this house. Fleet-backed houses build a fresh copy on each access."""
+        if self.fleet is not None:
+            return self.fleet.frame(self.row)
+        return self._df
+
+    @df.setter
+    def df(self, value):
+        if self.fleet is not None:
+            raise AttributeError("df of a fleet-backed house is read-only; write to house.fleet instead")
+        self._df = value
+
+    def hour_of_day(self, hour):
+        if self.fleet is not None:
+            return self.fleet.axis.hour_of_day[hour]
+        return self.axis.hour_of_day[hour]
+
+    def reduced_power_at(self, hour):
+        """True if smart EVs without solar charge at reduced power at this hour (TimeAxis lookup)."""
+        if self.fleet is not None:
+            return self.fleet.axis.reduced_power[hour]
+        return self.axis.reduced_power[hour]
+
+    def solar_at(self, hour):
+        if self.fleet is not None:
+            return self.fleet.solar_at(self.row, hour)
+        return self._df.loc[hour, "solar_production_Wh"]
+
+    def add_consumption(self, hour, energy_Wh):
+        if self.fleet is not None:
+            self.fleet.consumption[self.row, hour] += energy_Wh
+        else:
+            self._df.loc[hour, "energy_consumption_Wh"] += energy_Wh
+            House.df_writes += 1
+        if self.accumulator is not None:
+            self.accumulator.add(hour, self.row, energy_Wh)
+
+    def ev_charge_at(self, hour):
+        if self.fleet is not None:
+            return self.fleet.ev_charge[self.row, hour]
+        return self._df.loc[hour, "ev_charge_Wh"]
+
+    def set_ev_charge(self, hour, value):
+        if self.fleet is not None:
+            self.fleet.ev_charge[self.row, hour] = value
+        else:
+            self._df.loc[hour, "ev_charge_Wh"] = value
+            House.df_writes += 1
+
+    def mark_away(self, start, stop):
+        """Set ev_charge_Wh to NaN for hours start..stop-1 (car away from home)."""
+        if stop <= start:
+            return
+        if self.fleet is not None:
+            self.fleet.ev_charge[self.row, start:stop] = np.nan
+        else:
+            self._df.loc[start:stop - 1, "ev_charge_Wh"] = np.nan
+            House.df_writes += 1
+
+    def set_solar_production(self, production_Wh, scale=1.0):
+        """Install panels producing scale x production_Wh (see solar.panel_scale)."""
+        self.has_solar = True
+        if self.fleet is not None:
+            # the fleet keeps one shared profile and this house's scale
+            self.fleet.set_solar(self.row, production_Wh, scale)
+        else:
+            self._df["solar_production_Wh"] = production_Wh if scale == 1.0 else scale * np.asarray(production_Wh)
+            House.df_writes += 1
 
     def assign_ev(self, ev):
         self.ev = ev
@@ -56,4 +210,8 @@ class House:
             self.ev_type = "Smart"
         else:
             self.ev_type = "Non-Smart"
-        self.df["ev_charge_Wh"] = ev.current_charge
+        if self.fleet is not None:
+            self.fleet.ev_charge[self.row] = ev.current_charge
+        else:
+            self._df["ev_charge_Wh"] = ev.current_charge
+            House.df_writes += 1
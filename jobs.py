@@ -0,0 +1,71 @@
+import threading
+from contextlib import nullcontext
+from simulation import run_simulation, SimulationCancelled
+from result_cache import cache_key
+
+# a run without rng= reseeds and draws from the process-global np.random / random,
+# so jobs of different sessions must not run one at the same time
+SEEDED_RUN_LOCK = threading.Lock()
+
+
+class SimulationJob:
+    """
+    One run_simulation call in a background thread, for callers (the Streamlit app)
+    that must stay responsive while it runs.
+
+    hours_done / hours report progress, cancel() stops the run at the next hour.
+    When the run finishes the result is stored in `cache` (a ResultCache) under
+    cache_key(...), and in `result`; a failure other than cancelling is kept in
+    `error`. Jobs without an rng= Generator wait for each other (SEEDED_RUN_LOCK), so
+    concurrent jobs give the same results as one run on its own.
+    """
+
+    def __init__(self, num_houses, num_solar, num_evs, num_smart_evs, seed=42, cache=None, **kwargs):
+        self.key = cache_key(num_houses, num_solar, num_evs, num_smart_evs, seed)
+        self.cache = cache
+        self.kwargs = kwargs
+        self.hours = kwargs.get("hours", 168)
+        self.hours_done = 0
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _progress(self, hours_done, hours):
+        self.hours_done = hours_done
+        self.hours = hours
+
+    def _run(self):
+        num_houses, num_solar, num_evs, num_smart_evs, seed = self.key
+        try:
+            with SEEDED_RUN_LOCK if self.kwargs.get("rng") is None else nullcontext():
+                res = run_simulation(num_houses, num_solar, num_evs, num_smart_evs, seed=seed,
+                                     progress=self._progress, cancel=self._cancel, **self.kwargs)
+        except SimulationCancelled:
+            self.cancelled = True
+            return
+        except Exception as exc:
+            self.error = exc
+            return
+        if self.cache is not None:
+            self.cache.put(self.key, res)
+        self.result = res
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def fraction(self):
+        return self.hours_done / self.hours if self.hours else 0.0
+
+    def running(self):
+        return self._thread.is_alive()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+        return self
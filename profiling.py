@@ -0,0 +1,116 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# open RunProfiles tracing memory; tracemalloc is stopped when the last one closes
+_tracing = {"profiles": 0, "started": False}
+_tracing_lock = threading.Lock()
+
+
+class RunProfile:
+    """
+    Instrumentation of one simulation run: wall time and peak traced memory per
+    phase plus event counters. Phases with the same name add up.
+
+    With trace_memory, memory is traced with tracemalloc while the profile is open,
+    which makes the run about 3x slower; the wall times are then for comparing
+    phases, not for benchmarking. tracemalloc is process-global, so the memory
+    figures are only valid for one run at a time: a run in another thread adds its
+    allocations to the peaks (and resets them). Tracing stops when the last open
+    profile that traces memory closes, unless it was already on before.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.phases = {}
+        self.counters = {}
+        self._tracing = False
+        self._opened = None
+
+    def open(self):
+        self._opened = time.perf_counter()
+        if self.trace_memory:
+            with _tracing_lock:
+                if _tracing["profiles"] == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _tracing["started"] = True
+                _tracing["profiles"] += 1
+            self._tracing = True
+        return self
+
+    def close(self):
+        self.wall_s = time.perf_counter() - self._opened
+        if self._tracing:
+            with _tracing_lock:
+                _tracing["profiles"] -= 1
+                if _tracing["profiles"] == 0 and _tracing["started"]:
+                    tracemalloc.stop()
+                    _tracing["started"] = False
+            self._tracing = False
+
+    @contextmanager
+    def phase(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, {"wall_s": 0.0, "peak_mem_bytes": 0})
+            stats["wall_s"] += time.perf_counter() - start
+            if self.trace_memory:
+                stats["peak_mem_bytes"] = max(stats["peak_mem_bytes"], tracemalloc.get_traced_memory()[1])
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        return {
+            "wall_s": getattr(self, "wall_s", None),
+            "trace_memory": self.trace_memory,
+            "phases": {name: dict(stats) for name, stats in self.phases.items()},
+            "counters": dict(self.counters)
+        }
+
+
+class NullProfile:
+    """Stand-in for RunProfile when instrumentation is off (every call is a no-op)."""
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def count(self, name, n=1):
+        pass
+
+    def close(self):
+        pass
+
+
+def format_profile(profile):
+    """Text table of a profile dict (results["profile"]); peak memory only when it was traced."""
+    memory = profile.get("trace_memory", True)
+    lines = [f"{'phase':<16}{'wall (ms)':>12}" + (f"{'peak mem (MB)':>16}" if memory else "")]
+    for name, stats in profile["phases"].items():
+        line = f"{name:<16}{stats['wall_s'] * 1000:>12.1f}"
+        lines.append(line + (f"{stats['peak_mem_bytes'] / 1e6:>16.2f}" if memory else ""))
+    if profile.get("wall_s") is not None:
+        lines.append(f"{'total':<16}{profile['wall_s'] * 1000:>12.1f}")
+    for name, value in profile["counters"].items():
+        lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+def profile_run(stats_path, *args, **kwargs):
+    """
+    Run run_simulation(*args, **kwargs) under cProfile and dump the stats to
+    stats_path (read them with pstats or snakeviz). Returns the results.
+    """
+    import cProfile
+    from simulation import run_simulation
+
+    profiler = cProfile.Profile()
+    res = profiler.runcall(run_simulation, *args, **kwargs)
+    profiler.dump_stats(stats_path)
+    return res
@@ -0,0 +1,137 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import checkpoint
+from data_frames import load_hourly_solar
+from benchmark import check_engines, GOLDEN_HOUSES, CHECK_RTOL
+from ensemble import run_ensemble
+from horizon import run_horizon, resume_horizon
+from sharded import run_sharded
+from simulation import run_simulation, solar_start
+
+
+def _same(a, b):
+    """Keys of two totals / per-hour dicts whose values differ at all (bit for bit)."""
+    return [k for k in a if not np.array_equal(np.asarray(a[k]), np.asarray(b[k]))]
+
+
+def check_golden():
+    """Every engine against the original code's totals (benchmark.GOLDEN_TOTALS) and the DataFrame scan."""
+    result = check_engines(GOLDEN_HOUSES)
+    return [f"{name}: {bad}" for name, bad in result["mismatches"].items() if bad]
+
+
+def check_generator_engines():
+    """With rng=, the dataframe and columnar engines draw the same numbers and agree within CHECK_RTOL."""
+    ref = run_simulation(60, 25, 30, 12, engine="dataframe", rng=np.random.default_rng(7))
+    res = run_simulation(60, 25, 30, 12, engine="columnar", rng=np.random.default_rng(7))
+    bad = [k for k, v in ref["totals"].items()
+           if k != "counts" and not np.isclose(v, res["totals"][k], rtol=CHECK_RTOL)]
+    bad += [k for k, v in ref["per_hour"].items() if not np.allclose(v, res["per_hour"][k], rtol=CHECK_RTOL)]
+    return bad
+
+
+def check_shards():
+    """run_sharded gives the same numbers for any number of shards."""
+    one = run_sharded(3000, 1200, 900, 450, seed=3, feeders=[1000, 1000, 1000], shards=1, workers=1)
+    three = run_sharded(3000, 1200, 900, 450, seed=3, feeders=[1000, 1000, 1000], shards=3, workers=1)
+    return _same(one["totals"], three["totals"]) + _same(one["per_hour"], three["per_hour"])
+
+
+def check_ensemble():
+    """run_ensemble gives the same numbers in this process and in two workers."""
+    params = {"num_houses": 40, "num_solar": 15, "num_evs": 12, "num_smart_evs": 6}
+    serial = run_ensemble(params, 4, workers=1, seed=5)
+    pooled = run_ensemble(params, 4, workers=2, seed=5)
+    return _same(serial["samples"], pooled["samples"])
+
+
+def _cut_after(path, records):
+    """Truncate a checkpoint file after `records` records, as if the process died writing the next one."""
+    with open(path, "r+b") as f:
+        f.seek(len(checkpoint.MAGIC))
+        for _ in range(records):
+            _, length = checkpoint._FRAME.unpack(f.read(checkpoint._FRAME.size))
+            f.seek(length + checkpoint._CRC.size, os.SEEK_CUR)
+        # half a frame of the next record
+        f.truncate(f.tell() + checkpoint._FRAME.size // 2)
+
+
+def check_resume():
+    """A run_horizon run cut after its first checkpoint and resumed equals the uninterrupted run."""
+    bad = []
+    args = (200, 80, 60, 30)
+    kwargs = {"hours": 24 * 7 * 4, "chunk_hours": 168, "seed": 11}
+    with tempfile.TemporaryDirectory() as tmp:
+        for streamed in (False, True):
+            ref_out = os.path.join(tmp, "ref.csv") if streamed else None
+            out = os.path.join(tmp, "run.csv") if streamed else None
+            path = os.path.join(tmp, f"run{int(streamed)}.ckpt")
+            ref = run_horizon(*args, out=ref_out, **kwargs)
+            run_horizon(*args, out=out, checkpoint=path, checkpoint_hours=336, **kwargs)
+            # HEAD and the first state (hour 336) survive
+            _cut_after(path, 2)
+            label = "streamed " if streamed else ""
+            if len(checkpoint.read_checkpoint(path)[1]) != 1:
+                bad.append(label + "cut checkpoint")
+            res = resume_horizon(path, out=out)
+            bad += [label + k for k in _same(ref["totals"], res["totals"]) + _same(ref["cost"], res["cost"])]
+            if streamed:
+                with open(ref_out, "rb") as a, open(out, "rb") as b:
+                    if a.read() != b.read():
+                        bad.append("streamed csv")
+            else:
+                bad += _same(ref["per_hour"], res["per_hour"])
+    return bad
+
+
+def _months(time):
+    return time.astype("datetime64[M]").astype(np.int64) % 12
+
+
+def check_calendar():
+    """
+    Long runs are dated by the solar data: a streamed full-year run_horizon run has
+    the data's timestamps and its monthly solar production has the data's monthly
+    shape; a run_simulation run longer than a week starts where the data starts.
+    """
+    bad = []
+    data_time, data_Wh = load_hourly_solar()
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "year.csv")
+        run_horizon(20, 10, 4, 2, hours=len(data_time), seed=2, out=out)
+        table = np.genfromtxt(out, delimiter=",", names=True, dtype=None, encoding=None)
+    time = table["time"].astype("datetime64[m]")
+    if not np.array_equal(time, data_time.astype("datetime64[m]")):
+        bad.append("horizon time")
+    monthly = np.bincount(_months(time), table["solar_production"], minlength=12)
+    data_monthly = np.bincount(_months(data_time), data_Wh, minlength=12)
+    # the profile is rolled by 6 hours (aligned_solar_profile), which moves only night hours between months
+    if not np.allclose(monthly / monthly.sum(), data_monthly / data_monthly.sum(), atol=1e-4):
+        bad.append("horizon monthly solar")
+    for engine in ("dataframe", "columnar"):
+        res = run_simulation(5, 2, 1, 1, engine=engine, hours=24 * 40)
+        if res["houses"][0].axis.time[0] != solar_start():
+            bad.append(f"{engine} start")
+    return bad
+
+
+CHECKS = (check_golden, check_generator_engines, check_shards, check_ensemble, check_resume, check_calendar)
+
+
+def main():
+    """
+    python regression.py
+    Runs every check in CHECKS and exits with status 1 when one of them finds a difference.
+    """
+    failed = False
+    for check in CHECKS:
+        bad = check()
+        failed = failed or bool(bad)
+        print(f"{check.__name__:<24} {'MISMATCH ' + str(bad) if bad else 'OK'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
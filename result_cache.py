@@ -0,0 +1,121 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+
+def cache_key(num_houses, num_solar, num_evs, num_smart_evs, seed=42):
+    """Key of one simulation result: the parameters that determine it."""
+    return (int(num_houses), int(num_solar), int(num_evs), int(num_smart_evs), int(seed))
+
+
+# run_simulation results that are numbers only (no house, EV or FleetState objects)
+SUMMARY_KEYS = ("totals", "per_hour", "cost", "energy_balance", "per_step", "step_minutes", "profile")
+
+
+def result_summary(res):
+    """The SUMMARY_KEYS entries of a run_simulation result: kilobytes, whatever the number of houses."""
+    return {key: res[key] for key in SUMMARY_KEYS if key in res}
+
+
+class ResultCache:
+    """
+    Least-recently-used cache of simulation results keyed on cache_key(...).
+
+    At most max_entries results are kept in memory. With a directory, every result
+    is also pickled there (one file per key) and read back on a memory miss, so
+    results survive a restart of the app; the directory keeps at most max_disk_entries
+    files (None: no limit) and at most max_disk_bytes bytes (None: no limit), the
+    least recently used are deleted first. to_disk(value) gives what is pickled
+    (default the value itself), e.g. result_summary to leave out the per-house
+    objects; a value read back from disk is that reduced one. Safe to share between
+    threads.
+    """
+
+    def __init__(self, max_entries=8, directory=None, max_disk_entries=64, max_disk_bytes=None, to_disk=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.to_disk = to_disk
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries or (self._path(key) is not None and os.path.exists(self._path(key)))
+
+    def _path(self, key):
+        if self.directory is None:
+            return None
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{digest}.pkl")
+
+    def get(self, key, default=None):
+        """Result for key (marked as most recently used), or default."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            path = self._path(key)
+            if path is None or not os.path.exists(path):
+                return default
+            try:
+                with open(path, "rb") as f:
+                    stored_key, value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                return default
+            if stored_key != key:
+                return default
+            os.utime(path)
+            self._remember(key, value)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+            path = self._path(key)
+            if path is not None:
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    stored = value if self.to_disk is None else self.to_disk(value)
+                    pickle.dump((key, stored), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+                self._trim_directory()
+
+    def clear(self):
+        """Drop every result from memory and from the directory."""
+        with self._lock:
+            self._entries.clear()
+            if self.directory is not None:
+                for name in os.listdir(self.directory):
+                    if name.endswith(".pkl"):
+                        os.remove(os.path.join(self.directory, name))
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _trim_directory(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                st = os.stat(os.path.join(self.directory, name))
+                files.append((st.st_mtime, st.st_size, os.path.join(self.directory, name)))
+        files.sort()
+        count, size = len(files), sum(f[1] for f in files)
+        for _, file_size, path in files:
+            if ((self.max_disk_entries is None or count <= self.max_disk_entries)
+                    and (self.max_disk_bytes is None or size <= self.max_disk_bytes)):
+                break
+            os.remove(path)
+            count -= 1
+            size -= file_size
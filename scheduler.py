@@ -0,0 +1,49 @@
+import numpy as np
+
+# event kinds
+UNPLUG = 0
+PLUG = 1
+
+
+class EventSchedule:
+    """
+    Plug/unplug events of a run as flat arrays sorted by hour (then EV), built once
+    from the leave/return arrays of trips.sample_trips.
+
+    at(hour) returns the events of one hour as array slices, so the hourly loop only
+    looks at the cars whose state changes in that hour. Within an hour events keep the
+    EV order of the old per-hour event lists, so random draws made per plug event
+    come out in the same order.
+    """
+
+    def __init__(self, leave, ret, hours):
+        n_evs, days = leave.shape
+        time = np.concatenate([leave.ravel(), ret.ravel()])
+        ev = np.tile(np.repeat(np.arange(n_evs), days), 2)
+        day = np.tile(np.arange(days), 2 * n_evs)
+        kind = np.repeat(np.array([UNPLUG, PLUG], dtype=np.int8), n_evs * days)
+
+        # events outside the simulated hours never fire
+        keep = (time >= 0) & (time < hours)
+        time, ev, day, kind = time[keep], ev[keep], day[keep], kind[keep]
+        order = np.lexsort((ev, time))
+        self.time = time[order]
+        self.ev = ev[order]
+        self.day = day[order]
+        self.kind = kind[order]
+        # events of hour h are bounds[h]:bounds[h + 1]
+        self.bounds = np.searchsorted(self.time, np.arange(hours + 1))
+
+    def __len__(self):
+        return len(self.time)
+
+    def at(self, hour):
+        """(ev, day, kind) arrays of the events at `hour`, in EV order."""
+        events = slice(self.bounds[hour], self.bounds[hour + 1])
+        return self.ev[events], self.day[events], self.kind[events]
+
+    def split(self, hour):
+        """(unplugged, plugged, plugged_day): EV positions leaving / coming home at `hour`."""
+        ev, day, kind = self.at(hour)
+        plug = kind == PLUG
+        return ev[~plug], ev[plug], day[plug]
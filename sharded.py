@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from simulation import run_simulation, totals_from_sums
+
+# houses per feeder when no feeder sizes are given
+FEEDER_HOUSES = 2000
+
+# totals that are sums over houses; the averages are recomputed from them
+_SUMMED_TOTALS = {
+    "total_all_Wh": "all", "total_smart_Wh": "smart", "total_non_smart_Wh": "non_smart",
+    "total_no_ev_Wh": "no_ev", "total_solar_production_Wh": "solar_production",
+}
+_PEAK_TOTALS = {"total_peak_Wh": "all", "total_peak_smart_Wh": "smart", "total_peak_non_smart_Wh": "non_smart"}
+
+
+def feeder_sizes(num_houses, feeder_houses=FEEDER_HOUSES):
+    """Houses per feeder: blocks of feeder_houses, the last one smaller."""
+    sizes = [feeder_houses] * (num_houses // feeder_houses)
+    if num_houses % feeder_houses:
+        sizes.append(num_houses % feeder_houses)
+    return sizes
+
+
+def feeder_specs(num_houses, num_solar, num_evs, num_smart_evs, seed=42, feeders=None):
+    """
+    One (houses, solar, evs, smart_evs, seed_sequence) tuple per feeder.
+
+    feeders: houses per feeder (default feeder_sizes(num_houses)). Solar houses, EVs
+    and smart EVs are spread over the feeders by multivariate hypergeometric draws
+    from default_rng(seed), as if they were picked among all houses at once; every
+    feeder draws the rest from its own child of SeedSequence(seed). Nothing depends
+    on how the feeders are later grouped into shards.
+    """
+    sizes = np.asarray(feeder_sizes(num_houses) if feeders is None else feeders, dtype=np.int64)
+    if sizes.sum() != num_houses or (sizes <= 0).any():
+        raise ValueError("feeder sizes must be positive and add up to num_houses")
+    rng = np.random.default_rng(seed)
+    solar = rng.multivariate_hypergeometric(sizes, num_solar)
+    evs = rng.multivariate_hypergeometric(sizes, num_evs)
+    smart = rng.multivariate_hypergeometric(evs, num_smart_evs)
+    streams = np.random.SeedSequence(seed).spawn(len(sizes))
+    return [tuple(int(n) for n in counts) + (stream,)
+            for counts, stream in zip(zip(sizes, solar, evs, smart), streams)]
+
+
+def _feeder_part(res):
+    """The additive parts of one feeder's results (per-group sums, not averages)."""
+    totals = res["totals"]
+    part = {
+        "sums": {group: totals[key] for key, group in _SUMMED_TOTALS.items()},
+        "peak_sums": {group: totals[key] for key, group in _PEAK_TOTALS.items()},
+        "counts": totals["counts"],
+        "total_solar_ev_Wh": totals["total_solar_ev_Wh"],
+        "per_hour": res["per_hour"],
+        "cost": res["cost"],
+        "energy_balance": res["energy_balance"],
+    }
+    if "per_step" in res:
+        part["per_step"] = res["per_step"]
+    return part
+
+
+def run_shard(specs, kwargs):
+    """
+    Simulate the feeders of one shard one after another (each with its own
+    Generator) and return their additive parts, in feeder order. Only one
+    feeder's matrices exist at a time.
+    """
+    parts = []
+    for houses, solar, evs, smart, stream in specs:
+        res = run_simulation(houses, solar, evs, smart, rng=np.random.default_rng(stream), **kwargs)
+        parts.append(_feeder_part(res))
+        del res
+    return parts
+
+
+def _add(total, part):
+    """Element-wise sum of two nested dicts of numbers / arrays with the same keys."""
+    if isinstance(total, dict):
+        return {key: _add(total[key], part[key]) for key in total}
+    return total + part
+
+
+def merge_parts(parts):
+    """
+    Reduce feeder parts into the results dict of run_simulation (without the house
+    and EV objects). The parts are added in feeder order, so the float sums are the
+    same however the feeders were sharded.
+    """
+    merged = parts[0]
+    for part in parts[1:]:
+        merged = _add(merged, part)
+    results = {
+        "totals": totals_from_sums(merged["sums"], merged["peak_sums"], merged["counts"], merged["total_solar_ev_Wh"]),
+        "per_hour": merged["per_hour"],
+        "cost": merged["cost"],
+        "energy_balance": merged["energy_balance"],
+        "feeders": len(parts),
+    }
+    if "per_step" in merged:
+        results["per_step"] = merged["per_step"]
+    return results
+
+
+def run_sharded(num_houses, num_solar, num_evs, num_smart_evs, seed=42, feeders=None, shards=None, workers=None,
+                engine="columnar", **kwargs):
+    """
+    One large neighbourhood simulated in worker processes, split by feeder.
+
+    Houses only interact through the aggregates, so every feeder (feeder_specs) is
+    simulated on its own and the per-group sums are added up. Feeders are grouped
+    into `shards` contiguous runs (default: one per worker) and each shard runs in
+    a spawned worker process (`workers`, default the number of CPUs; 1 runs in this
+    process). A worker holds one feeder at a time, so its memory depends on the
+    feeder size, not on num_houses.
+
+    Results do not depend on shards or workers; they do depend on the feeder layout
+    and are statistically equivalent to, not the same numbers as, run_simulation.
+    With charging="coordinated" the smart EVs of each feeder fill the valleys of
+    that feeder's load. engine is "columnar" or "compact"; other keyword arguments
+    go to run_simulation (hours, step_minutes, tariff, charging, scalar or "lognormal" panel_kwp /
+    panel_multiplier).
+    Returns dict with keys: totals, per_hour, cost, energy_balance, feeders (plus
+    per_step with sub-hourly steps).
+    """
+    specs = feeder_specs(num_houses, num_solar, num_evs, num_smart_evs, seed, feeders)
+    kwargs["engine"] = engine
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if shards is None:
+        shards = workers
+    shards = max(1, min(shards, len(specs)))
+    bounds = np.linspace(0, len(specs), shards + 1).astype(int)
+    shard_specs = [specs[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    if workers <= 1:
+        parts = [part for shard in shard_specs for part in run_shard(shard, kwargs)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, shards), mp_context=multiprocessing.get_context("spawn")) as pool:
+            # map keeps the shard order, so the parts stay in feeder order
+            parts = [part for shard in pool.map(run_shard, shard_specs, [kwargs] * shards) for part in shard]
+    return merge_parts(parts)
@@ -1,85 +1,391 @@
+import time
+# start of the simulator's own imports, reported by the command-line entry point
+_IMPORT_STARTED = time.perf_counter()
+
+import argparse
+import json
+import sys
 import numpy as np
 import random
 from house import House
+from timeaxis import PEAK_HOURS, DEFAULT_TARIFF, time_axis
 from car import Car
-from data_frames import hourly_data_solar
-
-def run_simulation(num_houses, num_solar, num_evs, num_smart_evs, seed=42):
-    """
-    Run the 168-hour simulation and return results.
-    Returns dict with keys: houses, solar_houses, evs, totals, per_hour (dict)
-    """
-    np.random.seed(seed)
-    random.seed(seed)
-
-    houses = [House(house_id=i) for i in range(1, num_houses + 1)]
-
-    # assign solar
-    solar_houses = []
-    if num_solar > 0:
-        solar_houses = list(np.random.choice(houses, num_solar, replace=False))
-        # align solar (model.py used "Energy(Wh)" column and a 6-hour roll)
-        aligned_solar = np.roll(hourly_data_solar["Energy(Wh)"].values[:168], 6)
-        for house in solar_houses:
-            house.has_solar = True
-            house.df["solar_production_Wh"] = aligned_solar
-
-    # assign EVs
-    evs = []
-    if num_evs > 0:
-        ev_houses = list(np.random.choice(houses, num_evs, replace=False))
-        for i, house in enumerate(ev_houses, start=1):
-            smart = True if i <= num_smart_evs else False
-            current_charge = np.random.randint(1000, 60000)
-            car = Car(car_id=i, house=house, current_charge=current_charge, smart=smart)
-            house.assign_ev(car)
-            evs.append(car)
-
-    # helper for daily leave/return (now matches model.py distribution)
-    def sample_leave_return_for_week():
-        intervals = []
-        for day in range(7):
-            leave_local = 7 + random.choice([-1, 0, 1])
-            # match model.py: allow much wider return variability
-            return_local = 19 + random.choice([-5, -4, -3, -2, -1, 0, 1])
-            leave = day * 24 + leave_local
-            ret = day * 24 + return_local
-            if ret <= leave:
-                ret = min(leave + 8, day*24 + 23)
-            intervals.append((leave, ret))
-        return intervals
-
-    # build events and mark away hours
-    events = {}
-    for ev in evs:
-        intervals = sample_leave_return_for_week()
-        for leave, ret in intervals:
-            events.setdefault(leave, []).append((ev, "unplug"))
-            events.setdefault(ret, []).append((ev, "plug"))
-            for h in range(leave, min(ret, 168)):
-                ev.house.df.loc[h, "ev_charge_Wh"] = np.nan
-
-    # run hourly simulation
-    for hour in range(168):
-        for (ev, action) in events.get(hour, []):
-            if action == "unplug":
-                ev.unplug(hour)
-            elif action == "plug":
-                return_charge = random.randint(int(0.10 * ev.capacity), int(0.40 * ev.capacity))
-                ev.current_charge = return_charge
-                ev.plug(hour)
-                try:
-                    ev.house.df.loc[hour, "ev_charge_Wh"] = ev.current_charge
-                except Exception:
-                    pass
-
-        for ev in evs:
-            if not ev.connected:
-                continue
-            if ev.current_charge < ev.capacity:
-                charged = ev.charge(hour)
-                ev.current_charge = min(ev.capacity, ev.current_charge + charged)
-                ev.house.df.loc[hour, "ev_charge_Wh"] = ev.current_charge
+from aggregate import GroupAccumulator, CONSUMPTION_GROUPS
+from trips import sample_trips, trips_from_intervals
+from scheduler import EventSchedule, PLUG
+from profiling import RunProfile, NullProfile, format_profile
+from fleet import FleetState
+from data_frames import load_hourly_solar, solar_energy_Wh, STEP_MINUTES
+from solar import panel_scale, resolve_panel_kwp, LOGNORMAL_KWP
+from coordination import schedule_fleet
+from balance import group_balance, balance_results
+
+ENGINES = ("dataframe", "columnar", "compact")
+# engines that keep every house in a FleetState, and the dtype of its matrices
+FLEET_DTYPES = {"columnar": np.float64, "compact": np.float32}
+# "greedy": every EV charges as soon as it can (the charging rules of Car.charge);
+# "coordinated": smart EVs follow valley-filling schedules (coordination.py)
+CHARGING_MODES = ("greedy", "coordinated")
+
+
+def aligned_solar_profile(hours=168, step_minutes=60):
+    """
+    Solar production (Wh per step) for the first `hours` hours of the yearly data,
+    rolled by 6 hours; one value per hour, or per step of step_minutes.
+    """
+    solar = solar_energy_Wh(step_minutes=step_minutes)
+    steps_per_hour = 60 // step_minutes
+    if hours * steps_per_hour > len(solar):
+        raise ValueError(f"horizon of {hours} hours exceeds the {len(solar) // steps_per_hour} hours of solar data")
+    # align solar (model.py used "Energy(Wh)" column and a 6-hour roll)
+    return np.roll(solar[:hours * steps_per_hour], 6 * steps_per_hour)
+
+
+def solar_start():
+    """First timestamp of the solar data (numpy datetime64)."""
+    return load_hourly_solar()[0][0]
+
+
+def run_start(hours):
+    """
+    First timestamp of the time axis of a run of `hours` hours: the original week
+    (2023-08-31) for up to 168 hours, else the first timestamp of the solar data, so
+    the months of a longer run's per-hour series are the months of the solar data.
+    """
+    return "2023-08-31" if hours <= 168 else solar_start()
+
+
+def sample_leave_return(pick, days=7, first_day=0):
+    """
+    Daily leave/return hours for one EV (matches model.py distribution).
+    pick(options) draws one element; returns a list of (leave, return) hour indices
+    for days first_day .. first_day+days-1.
+    """
+    intervals = []
+    for day in range(first_day, first_day + days):
+        leave_local = 7 + pick([-1, 0, 1])
+        # match model.py: allow much wider return variability
+        return_local = 19 + pick([-5, -4, -3, -2, -1, 0, 1])
+        leave = day * 24 + leave_local
+        ret = day * 24 + return_local
+        if ret <= leave:
+            ret = min(leave + 8, day*24 + 23)
+        intervals.append((leave, ret))
+    return intervals
+
+class SimulationCancelled(Exception):
+    """Raised by run_simulation when its cancel event is set."""
+
+
+def run_simulation(num_houses, num_solar, num_evs, num_smart_evs, seed=42, engine="dataframe", rng=None, hours=168, profile=False,
+                   progress=None, cancel=None, panel_kwp=None, panel_multiplier=None, step_minutes=60,
+                   tariff=DEFAULT_TARIFF, charging="greedy"):
+    """
+    Run the simulation over `hours` hours (default one week, at most the length of
+    the yearly solar data) and return results. Every house keeps its full series in
+    memory; see horizon.run_horizon for long runs with bounded memory. Runs longer
+    than a week are dated by the solar data (run_start).
+    engine="dataframe" keeps one pandas DataFrame per house; engine="columnar" stores
+    every house in one FleetState (houses x hours NumPy matrices) and builds house.df
+    only on demand. Both draw the same random numbers and return the same results.
+    engine="compact" is the columnar engine with float32 matrices (see FleetState)
+    for the largest runs: same totals and per-hour series, about half the memory.
+    rng: optional numpy Generator. When given, every random draw comes from it instead
+    of the global np.random / random modules (seed is ignored) and houses are built in
+    one batch with House.batch. Same distributions, but not the same numbers as the
+    seeded run. Only this path draws the trips vectorized (trips.sample_trips, about
+    0.01 s for 100k EVs); the seeded path keeps the original scalar random.choice
+    draws, 14 per EV and week (about 2 s for 100k EVs), to reproduce the original
+    numbers.
+    profile=True adds a "profile" key with wall time and peak traced memory per phase
+    (houses, assignment, trips, away_marking, hourly_loop, coordination, balance, aggregation) and counters
+    (charge calls, plug/unplug events, DataFrame writes); see profiling.RunProfile.
+    A RunProfile instance can be passed instead of True, e.g.
+    RunProfile(trace_memory=False) for phase timings without the tracemalloc overhead
+    (about 3x); traced memory is only valid for one run at a time in the process.
+    panel_kwp / panel_multiplier: installation size (kWp) and orientation/shading
+    factor of the solar houses, scalars or one value per solar house (in the order
+    of solar_houses); see solar.panel_scale. The default is the installation of the
+    solar data for every house. panel_kwp="lognormal" draws the sizes with
+    solar.draw_panel_kwp, from rng or, in the seeded run, from its own
+    default_rng(seed) so the other draws do not change.
+    step_minutes: length of a time step (one of data_frames.STEP_MINUTES; columnar engine only
+    below 60). Solar comes from the minute data resampled to the step, each hour's
+    base load is spread over its steps and EVs charge power x step length per step,
+    so intra-hour peaks show up in the per-step series. The random draws are those
+    of the hourly run.
+    tariff: timeaxis.Tariff used for the "cost" of each consumption group.
+    charging="coordinated" (columnar engine only): smart EVs do not follow the
+    smart charging rules but get schedules that fill the valleys of the aggregate
+    load of everything else (base loads and non-smart charging), so each plug-in
+    session gets the same energy as far as possible while the neighbourhood peak
+    stays low; see coordination.schedule_fleet. Non-smart EVs and the random draws
+    are unchanged.
+    progress: optional callable progress(steps_done, steps), called after every
+    simulated step. cancel: optional threading.Event; when it is set the run stops at
+    the next step with SimulationCancelled.
+    Returns dict with keys: houses, solar_houses, evs, totals, per_hour (dict), cost
+    (energy cost per consumption group), energy_balance (self-consumption, solar
+    used by EVs, grid import and export per group and per hour, see balance.py), plus
+    per_step (dict of per-step series) and step_minutes when step_minutes < 60
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"unknown engine {engine!r}, expected one of {ENGINES}")
+    # the steps the solar data can be resampled to, checked before anything is built
+    if step_minutes not in STEP_MINUTES:
+        raise ValueError(f"step_minutes must be one of {STEP_MINUTES}")
+    if step_minutes != 60 and engine not in FLEET_DTYPES:
+        raise ValueError("sub-hourly steps need engine='columnar' or 'compact'")
+    if charging not in CHARGING_MODES:
+        raise ValueError(f"unknown charging mode {charging!r}, expected one of {CHARGING_MODES}")
+    coordinated = charging == "coordinated"
+    if coordinated and engine not in FLEET_DTYPES:
+        raise ValueError("coordinated charging needs engine='columnar' or 'compact'")
+    steps_per_hour = 60 // step_minutes
+    steps = hours * steps_per_hour
+
+    # fail before building any house if the horizon is longer than the solar data
+    aligned_solar = aligned_solar_profile(hours, step_minutes)
+    start = run_start(hours)
+
+    if isinstance(profile, RunProfile):
+        prof = profile.open()
+    else:
+        prof = RunProfile().open() if profile else NullProfile()
+    df_writes_before = House.df_writes
+    # the profile is closed and the houses are detached from the accumulator
+    # however the run ends (an error, SimulationCancelled)
+    houses = []
+    try:
+        with prof.phase("houses"):
+            fleet = None
+            if engine in FLEET_DTYPES:
+                fleet = FleetState(num_houses, num_evs, hours=hours, start=start, step_minutes=step_minutes, tariff=tariff,
+                                   dtype=FLEET_DTYPES[engine])
+            # calendar of the run: peak masks, reduced-power window and prices per step
+            axis = fleet.axis if fleet is not None else time_axis(hours, start, step_minutes, tariff)
+
+            if rng is None:
+                np.random.seed(seed)
+                random.seed(seed)
+                houses = [House(house_id=i, fleet=fleet, row=i - 1, hours=hours, start=start)
+                          for i in range(1, num_houses + 1)]
+                choose = np.random.choice
+                initial_charge = lambda: np.random.randint(1000, 60000)
+                pick = random.choice
+            else:
+                houses = House.batch(num_houses, rng, fleet=fleet, hours=hours, start=start)
+                choose = rng.choice
+                initial_charge = lambda: int(rng.integers(1000, 60000))
+                pick = lambda options: options[rng.integers(len(options))]
+
+        with prof.phase("assignment"):
+            # assign solar
+            solar_houses = []
+            if num_solar > 0:
+                solar_houses = list(choose(houses, num_solar, replace=False))
+            kwp = resolve_panel_kwp(panel_kwp, len(solar_houses), np.random.default_rng(seed) if rng is None else rng)
+            scales = panel_scale(len(solar_houses), kwp, panel_multiplier)
+            for house, scale in zip(solar_houses, scales.tolist()):
+                house.set_solar_production(aligned_solar, scale)
+
+            # assign EVs
+            evs = []
+            if num_evs > 0:
+                ev_houses = list(choose(houses, num_evs, replace=False))
+                for i, house in enumerate(ev_houses, start=1):
+                    smart = True if i <= num_smart_evs else False
+                    current_charge = initial_charge()
+                    car = Car(car_id=i, house=house, current_charge=current_charge, smart=smart, fleet=fleet, index=i - 1)
+                    house.assign_ev(car)
+                    evs.append(car)
+
+            # charge when coming home: 10-40% of capacity, one draw per plug event in EV order
+            low = [int(0.10 * ev.capacity) for ev in evs]
+            high = [int(0.40 * ev.capacity) for ev in evs]
+            if rng is None:
+                # scalar draws from the global random module, in the original order
+                return_charges_of = lambda plugged: [random.randint(low[i], high[i]) for i in plugged.tolist()]
+            else:
+                low, high = np.array(low, dtype=np.int64), np.array(high, dtype=np.int64)
+                return_charges_of = lambda plugged: rng.integers(low[plugged], high[plugged] + 1)
+
+        # sample trips (one leave/return per started day) as EVs x days arrays
+        with prof.phase("trips"):
+            days = -(-hours // 24)
+            if rng is None:
+                # scalar draws from the global random module, in the original order
+                leave, ret = trips_from_intervals([sample_leave_return(pick, days) for ev in evs])
+            else:
+                leave, ret = sample_trips(len(evs), days, rng)
+
+        # build the event schedule and mark away hours
+        with prof.phase("away_marking"):
+            # trips are in hours; events happen at the first step of the hour
+            leave_step, ret_step = leave * steps_per_hour, ret * steps_per_hour
+            if fleet is not None:
+                schedule = fleet.schedule_trips(leave_step, ret_step)
+            else:
+                schedule = EventSchedule(leave_step, ret_step, steps)
+                for ev, ev_leave, ev_ret in zip(evs, leave.tolist(), ret.tolist()):
+                    for day_leave, day_ret in zip(ev_leave, ev_ret):
+                        ev.house.mark_away(day_leave, min(day_ret, hours))
+
+        # streaming aggregates: base loads and solar production go in once, EV charging hour by hour
+        with prof.phase("aggregation"):
+            if fleet is not None:
+                has_solar, ev_row, smart = fleet.has_solar, fleet.ev_row, fleet.smart
+            else:
+                has_solar = np.array([h.has_solar for h in houses], dtype=bool)
+                ev_row = np.array([ev.house.row for ev in evs], dtype=np.intp)
+                smart = np.array([ev.smart for ev in evs], dtype=bool)
+            masks = group_masks(has_solar, ev_row, smart)
+            acc = GroupAccumulator(masks, steps, len(evs))
+            if fleet is not None:
+                acc.add_profiles(fleet.consumption)
+            else:
+                acc.add_profiles(np.array([h.df["energy_consumption_Wh"].to_numpy() for h in houses]).reshape(num_houses, hours))
+                for house in houses:
+                    house.accumulator = acc
+            acc.add_solar(aligned_solar, scales.sum())
+            # smart EVs at solar houses, for the solar-used-by-EV estimate
+            tracked = np.flatnonzero(smart & has_solar[ev_row])
+            tracked_capacity = np.array([evs[i].capacity for i in tracked], dtype=float)
+            # energy a car can take from the panels in one step
+            tracked_power = np.array([evs[i].power for i in tracked], dtype=float) * (step_minutes / 60)
+            if coordinated:
+                # smart EVs only plug in and out in the loop; their charging is scheduled
+                # afterwards, with the charge at the start and at every arrival
+                fleet.scheduled[:] = smart
+                initial_soc = fleet.soc.copy()
+                arrival = np.zeros((len(evs), days))
+
+        # run the simulation step by step (hours by default): each step applies that
+        # step's events, then charges the active set (cars plugged in and not full)
+        # instead of checking every EV
+        # every event of the schedule fires once
+        plug_events = int(np.count_nonzero(schedule.kind == PLUG))
+        unplug_events = len(schedule) - plug_events
+        charge_calls = 0
+        with prof.phase("hourly_loop"):
+            if fleet is None:
+                active = {i for i, ev in enumerate(evs) if ev.connected and ev.current_charge < ev.capacity}
+                # energy charged per EV and step, kept by the fleet in the columnar engine
+                ev_energy = np.zeros((len(evs), steps))
+            else:
+                def arrival_of(plugged, day):
+                    return_charges = return_charges_of(plugged)
+                    if coordinated:
+                        arrival[plugged, day] = return_charges
+                    return return_charges
+            for step in range(steps):
+                if fleet is not None:
+                    # every event and every active EV at once with the batched charging kernel
+                    rows, grid = fleet.step(step, schedule, arrival_of)
+                    charge_calls += len(rows)
+                    acc.add(step, rows, grid)
+                else:
+                    unplugged, plugged, _ = schedule.split(step)
+                    return_charges = return_charges_of(plugged)
+                    for i in unplugged.tolist():
+                        evs[i].unplug(step)
+                        active.discard(i)
+                    for i, return_charge in zip(plugged.tolist(), np.asarray(return_charges).tolist()):
+                        ev = evs[i]
+                        ev.current_charge = return_charge
+                        ev.plug(step)
+                        if ev.current_charge < ev.capacity:
+                            active.add(i)
+                    # Car.charge reports its grid draw to the accumulator through House.add_consumption
+                    for i in sorted(active):
+                        ev = evs[i]
+                        charge_calls += 1
+                        charged = ev.charge(step)
+                        ev_energy[i, step] = charged
+                        ev.current_charge = min(ev.capacity, ev.current_charge + charged)
+                        ev.house.set_ev_charge(step, ev.current_charge)
+                        if ev.current_charge >= ev.capacity:
+                            active.discard(i)
+
+                if progress is not None:
+                    progress(step + 1, steps)
+                if cancel is not None and cancel.is_set():
+                    raise SimulationCancelled(f"cancelled after {step + 1} of {steps} steps")
+
+        if coordinated:
+            with prof.phase("coordination"):
+                index = np.flatnonzero(smart)
+                rows, steps_at, grid, _ = schedule_fleet(fleet, index, leave_step[index], ret_step[index],
+                                                         initial_soc[index], arrival[index], acc.consumption[0])
+                acc.add_entries(rows, steps_at, grid)
+                charge_calls += int(np.count_nonzero(grid))
+
+        # energy balance of the solar houses and solar use of the tracked EVs, on whole
+        # houses x steps matrices instead of hour by hour
+        with prof.phase("balance"):
+            solar_rows = np.flatnonzero(has_solar)
+            tracked_rows = ev_row[tracked]
+            if fleet is not None:
+                consumption_of = lambda rows: fleet.consumption[rows]
+                solar_of = fleet.solar_rows
+                tracked_charge = fleet.ev_charge[tracked_rows]
+                ev_energy = fleet.ev_energy
+            else:
+                consumption_of = lambda rows: _house_columns(houses, rows, "energy_consumption_Wh", steps)
+                solar_of = lambda rows: _house_columns(houses, rows, "solar_production_Wh", steps)
+                tracked_charge = _house_columns(houses, tracked_rows, "ev_charge_Wh", steps)
+            acc.solar_ev[tracked] = solar_ev_energy(tracked_charge, solar_of(tracked_rows), tracked_capacity, tracked_power)
+            by_group = group_balance(acc, solar_rows, consumption_of, solar_of, ev_row, ev_energy, smart & has_solar[ev_row])
+            energy_balance = balance_results(by_group, steps_per_hour)
+
+        with prof.phase("aggregation"):
+            connected = np.array([ev.connected for ev in evs], dtype=bool)
+            totals, per_hour = finish_totals(acc, axis, smart & has_solar[ev_row] & connected)
+            cost = group_costs(acc, axis)
+            if steps_per_hour > 1:
+                per_step = per_hour
+                per_hour = {name: series.reshape(hours, steps_per_hour).sum(axis=1) for name, series in per_step.items()}
+
+        results = {
+            "houses": houses,
+            "solar_houses": solar_houses,
+            "evs": evs,
+            "totals": totals,
+            "per_hour": per_hour,
+            "cost": cost,
+            "energy_balance": energy_balance
+        }
+        if steps_per_hour > 1:
+            results["per_step"] = per_step
+            results["step_minutes"] = step_minutes
+    finally:
+        if engine not in FLEET_DTYPES:
+            for house in houses:
+                house.accumulator = None
+        prof.close()
+    if profile:
+        # Car.charge calls in the DataFrame engine, EVs charged by the kernel in the columnar one
+        prof.count("charge_calls", charge_calls)
+        prof.count("plug_events", plug_events)
+        prof.count("unplug_events", unplug_events)
+        prof.count("dataframe_writes", House.df_writes - df_writes_before)
+        results["profile"] = prof.as_dict()
+    return results
+
+
+def _house_columns(houses, rows, column, steps):
+    """One DataFrame column of houses rows as a len(rows) x steps matrix."""
+    return np.array([houses[r].df[column].to_numpy() for r in rows], dtype=float).reshape(len(rows), steps)
+
+
+def aggregate_from_dataframes(houses, solar_houses):
+    """
+    Reference post-hoc aggregation: totals and per-hour series computed by scanning
+    each house's DataFrame (the original implementation). benchmark.check_engines
+    checks the streaming aggregates against it.
+    """
+    num_houses = len(houses)
+    hours = len(houses[0].df) if houses else 0
 
     # compute totals and per-hour aggregates (match model.py outputs)
     total_all_Wh = sum(h.df["energy_consumption_Wh"].sum() for h in houses)
@@ -96,7 +402,7 @@ def run_simulation(num_houses, num_solar, num_evs, num_smart_evs, seed=42):
     average_no_ev_Wh = total_no_ev_Wh / num_no_ev if num_no_ev > 0 else 0.0
 
     # peak hours totals (6-8 am and 6-9 pm)
-    peak_hours = list(range(6, 9)) + list(range(18, 22))
+    peak_hours = PEAK_HOURS
     total_peak_Wh = sum(h.df[h.df["time"].dt.hour.isin(peak_hours)]["energy_consumption_Wh"].sum() for h in houses)
     total_peak_smart_Wh = sum(h.df[h.df["time"].dt.hour.isin(peak_hours)]["energy_consumption_Wh"].sum() for h in houses if h.ev_type == "Smart")
     total_peak_non_smart_Wh = sum(h.df[h.df["time"].dt.hour.isin(peak_hours)]["energy_consumption_Wh"].sum() for h in houses if h.ev_type == "Non-Smart")
@@ -107,7 +413,7 @@ def run_simulation(num_houses, num_solar, num_evs, num_smart_evs, seed=42):
     for house in solar_houses:
         if house.ev is not None and house.ev_type == "Smart" and getattr(house.ev, "connected", True):
             total_number_of_smart_houses_with_solar += 1
-            for hour in range(168):
+            for hour in range(hours):
                 ev_charge = house.df.loc[hour, "ev_charge_Wh"]
                 # ensure car is present this hour
                 if not np.isnan(ev_charge) and ev_charge < house.ev.capacity:
@@ -132,15 +438,15 @@ def run_simulation(num_houses, num_solar, num_evs, num_smart_evs, seed=42):
         "total_solar_production_Wh": total_solar_prodction_Wh
     }
 
-    # per-hour totals (168) — expanded to include more series like model.py
-    per_hour_all = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in houses) for hr in range(168)])
-    per_hour_smart = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in houses if h.ev_type == "Smart") for hr in range(168)])
-    per_hour_non_smart = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in houses if h.ev_type == "Non-Smart") for hr in range(168)])
-    per_hour_no_ev = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in houses if h.ev is None) for hr in range(168)])
-    per_hour_solar_houses = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in solar_houses) for hr in range(168)]) if len(solar_houses) > 0 else np.zeros(168)
+    # per-hour totals (one per hour) — expanded to include more series like model.py
+    per_hour_all = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in houses) for hr in range(hours)])
+    per_hour_smart = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in houses if h.ev_type == "Smart") for hr in range(hours)])
+    per_hour_non_smart = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in houses if h.ev_type == "Non-Smart") for hr in range(hours)])
+    per_hour_no_ev = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in houses if h.ev is None) for hr in range(hours)])
+    per_hour_solar_houses = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in solar_houses) for hr in range(hours)]) if len(solar_houses) > 0 else np.zeros(hours)
     non_solar_houses = [h for h in houses if not h.has_solar]
-    per_hour_non_solar = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in non_solar_houses) for hr in range(168)]) if len(non_solar_houses) > 0 else np.zeros(168)
-    per_hour_solar_production = np.array([sum(h.df.loc[hr, "solar_production_Wh"] for h in solar_houses) for hr in range(168)]) if len(solar_houses) > 0 else np.zeros(168)
+    per_hour_non_solar = np.array([sum(h.df.loc[hr, "energy_consumption_Wh"] for h in non_solar_houses) for hr in range(hours)]) if len(non_solar_houses) > 0 else np.zeros(hours)
+    per_hour_solar_production = np.array([sum(h.df.loc[hr, "solar_production_Wh"] for h in solar_houses) for hr in range(hours)]) if len(solar_houses) > 0 else np.zeros(hours)
 
     per_hour = {
         "all": per_hour_all,
@@ -152,10 +458,238 @@ def run_simulation(num_houses, num_solar, num_evs, num_smart_evs, seed=42):
         "solar_production": per_hour_solar_production
     }
 
+    return totals, per_hour
+
+
+def group_masks(has_solar, ev_row, smart):
+    """
+    Boolean house masks for the reporting groups, from per-house solar flags and
+    per-EV house rows / smart flags.
+    """
+    num_houses = len(has_solar)
+    is_smart = np.zeros(num_houses, dtype=bool)
+    is_non_smart = np.zeros(num_houses, dtype=bool)
+    is_smart[ev_row[smart]] = True
+    is_non_smart[ev_row[~smart]] = True
+    return {
+        "smart": is_smart,
+        "non_smart": is_non_smart,
+        "no_ev": ~(is_smart | is_non_smart),
+        "solar_houses": has_solar,
+        "non_solar": ~has_solar
+    }
+
+
+def per_hour_sums(consumption, solar_production, masks):
+    """
+    Per-hour series (sum over houses of each group) from the houses x hours
+    consumption matrix and the per-hour production of all solar houses.
+    """
+    per_hour = {"all": consumption.sum(axis=0)}
+    for name in ("smart", "non_smart", "no_ev", "solar_houses", "non_solar"):
+        per_hour[name] = consumption[masks[name]].sum(axis=0)
+    per_hour["solar_production"] = np.asarray(solar_production, dtype=float)
+    return per_hour
+
+
+def solar_ev_energy(ev_charge, solar, capacity, power):
+    """
+    Estimated solar energy used per EV (match model.py): min(solar, power) summed over
+    the hours the car is home (ev_charge not NaN) and not full. Rows are EVs.
+    """
+    charging = ~np.isnan(ev_charge) & (ev_charge < capacity[:, None])
+    return np.where(charging, np.minimum(solar, power[:, None]), 0.0).sum(axis=1)
+
+
+def build_totals(per_hour, peak_per_hour, masks, total_solar_ev_Wh, smart_houses_with_solar):
+    """
+    Totals dict from per-hour series. peak_per_hour holds the peak-hour energy per
+    group ("all", "smart", "non_smart"), either summed already or as series.
+    """
+    counts = {"num_houses": len(masks["smart"]), "num_smart": int(masks["smart"].sum()),
+              "num_non_smart": int(masks["non_smart"].sum()), "num_no_ev": int(masks["no_ev"].sum()),
+              "smart_houses_with_solar": int(smart_houses_with_solar)}
+    return totals_from_sums(
+        {"all": np.sum(per_hour["all"]), "smart": np.sum(per_hour["smart"]), "non_smart": np.sum(per_hour["non_smart"]),
+         "no_ev": np.sum(per_hour["no_ev"]), "solar_production": np.sum(per_hour["solar_production"])},
+        {name: np.sum(peak_per_hour[name]) for name in ("all", "smart", "non_smart")},
+        counts, total_solar_ev_Wh
+    )
+
+
+def totals_from_sums(sums, peak_sums, counts, total_solar_ev_Wh):
+    """Totals dict from energy sums per group, peak-hour sums and the counts dict."""
+    num_smart, num_non_smart, num_no_ev = counts["num_smart"], counts["num_non_smart"], counts["num_no_ev"]
     return {
-        "houses": houses,
-        "solar_houses": solar_houses,
-        "evs": evs,
-        "totals": totals,
-        "per_hour": per_hour
-    }
\ No newline at end of file
+        "total_all_Wh": sums["all"],
+        "total_smart_Wh": sums["smart"],
+        "total_non_smart_Wh": sums["non_smart"],
+        "total_no_ev_Wh": sums["no_ev"],
+        "average_smart_Wh": sums["smart"] / num_smart if num_smart > 0 else 0.0,
+        "average_non_smart_Wh": sums["non_smart"] / num_non_smart if num_non_smart > 0 else 0.0,
+        "average_no_ev_Wh": sums["no_ev"] / num_no_ev if num_no_ev > 0 else 0.0,
+        "total_peak_Wh": peak_sums["all"],
+        "total_peak_smart_Wh": peak_sums["smart"],
+        "total_peak_non_smart_Wh": peak_sums["non_smart"],
+        "total_solar_ev_Wh": float(total_solar_ev_Wh),
+        "counts": dict(counts),
+        "total_solar_production_Wh": sums["solar_production"]
+    }
+
+
+def finish_totals(acc, axis, counted):
+    """
+    Totals and per-hour series from a GroupAccumulator at the end of a run, with the
+    peak mask of the run's TimeAxis.
+    counted: per-EV mask of the cars whose solar use is reported (smart EVs in solar
+    houses that are plugged in at the end, match model.py).
+    """
+    totals = build_totals(acc.per_hour(), acc.peak(axis.peak), acc.masks, acc.solar_ev[counted].sum(), counted.sum())
+    return totals, acc.per_hour()
+
+
+def group_costs(acc, axis, tariff=None):
+    """
+    Energy cost of every consumption group under the axis tariff (or another one):
+    one groups x steps by steps matrix-vector product.
+    """
+    return dict(zip(CONSUMPTION_GROUPS, axis.cost(acc.consumption, tariff).tolist()))
+
+
+def _write_results(path, res, params):
+    """Save totals and per-hour series: .npz (NumPy only), .csv or .json."""
+    totals = {k: v for k, v in res["totals"].items() if k != "counts"}
+    counts = res["totals"]["counts"]
+    if path.endswith(".npz"):
+        arrays = {f"per_hour_{k}": np.asarray(v) for k, v in res["per_hour"].items()}
+        arrays.update({f"totals_{k}": np.float64(v) for k, v in totals.items()})
+        arrays.update({f"counts_{k}": np.int64(v) for k, v in counts.items()})
+        arrays.update({f"param_{k}": v for k, v in params.items()})
+        np.savez_compressed(path, **arrays)
+    elif path.endswith(".csv"):
+        import pandas as pd
+
+        pd.DataFrame(res["per_hour"]).rename_axis("hour").to_csv(path)
+    elif path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump({"params": params, "totals": _jsonable_totals(res["totals"]),
+                       "per_hour": {k: np.asarray(v).tolist() for k, v in res["per_hour"].items()}}, f)
+    else:
+        raise ValueError(f"unsupported output format: {path} (use .npz, .csv or .json)")
+
+
+def _jsonable_totals(totals):
+    out = {k: float(v) for k, v in totals.items() if k != "counts"}
+    out["counts"] = {k: int(v) for k, v in totals["counts"].items()}
+    return out
+
+
+def _plot_day(path, per_hour, day):
+    """Line plot of one day of the per-hour series (same as model.py)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    start = day * 24
+    hours = list(range(24))
+    plt.figure(figsize=(12, 6))
+    for key, label, color in (("all", "All Houses", "gray"), ("smart", "Smart EV Houses", "blue"),
+                              ("non_smart", "Non-Smart EV Houses", "orange"), ("no_ev", "No EV Houses", "red"),
+                              ("solar_houses", "Solar Houses", "green"), ("non_solar", "Non-Solar Houses", "purple")):
+        plt.plot(hours, per_hour[key][start:start + 24], marker='o', label=label, color=color)
+    plt.xlabel("Hour of Day")
+    plt.ylabel("Energy Consumption (Wh)")
+    plt.title(f"Energy Consumption on Day {day + 1}")
+    plt.legend()
+    plt.xticks(hours)
+    plt.grid(axis='y')
+    plt.savefig(path)
+
+
+def main(argv=None):
+    """
+    Headless entry point: python -m simulation --houses 5000 --solar 2000 --evs 1500 --smart 800 --seed 7 --out results.npz
+    Prints the totals as JSON on stdout and timings on stderr. pandas and matplotlib
+    are only imported for --out *.csv and --plot.
+    """
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(prog="python -m simulation", description="Run the neighbourhood energy simulation without prompts.")
+    parser.add_argument("--houses", type=int, required=True, help="number of houses (>= 1)")
+    parser.add_argument("--solar", type=int, default=0, help="number of solar houses")
+    parser.add_argument("--evs", type=int, default=0, help="number of EVs")
+    parser.add_argument("--smart", type=int, default=0, help="number of smart EVs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--hours", type=int, default=168, help="simulated hours (default one week)")
+    parser.add_argument("--step", type=int, default=60, choices=STEP_MINUTES, metavar="MINUTES",
+                        help=f"time step in minutes (one of {', '.join(map(str, STEP_MINUTES))}; default 60)")
+    parser.add_argument("--engine", choices=ENGINES, default="columnar")
+    parser.add_argument("--charging", choices=CHARGING_MODES, default="greedy", help="smart EV charging (coordinated: valley filling, columnar engine)")
+    parser.add_argument("--panels", choices=("reference", LOGNORMAL_KWP), default="reference",
+                        help="solar installation sizes: the data's installation for every house, or lognormal draws")
+    parser.add_argument("--generator", action="store_true",
+                        help="draw from numpy Generator(seed) instead of the global random modules "
+                             "(other numbers; vectorized trips, much faster for large fleets)")
+    parser.add_argument("--out", help="write totals and per-hour series to .npz, .csv or .json")
+    parser.add_argument("--export", metavar="PATH", help="write every house's hourly series to .npz (compressed), .csv or .csv.gz")
+    parser.add_argument("--plot", metavar="PNG", help="save a plot of one day of the per-hour series")
+    parser.add_argument("--day", type=int, default=2, help="day plotted with --plot (0-based, default 2)")
+    parser.add_argument("--profile", action="store_true", help="print per-phase timings and counters on stderr")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, also trace peak memory per phase (tracemalloc, about 3x slower)")
+    parser.add_argument("--cprofile", metavar="STATS", help="run under cProfile and dump the stats to this file")
+    parser.add_argument("--workers", type=int, metavar="N", help="split the houses by feeder and run them in N worker processes (sharded.run_sharded)")
+    args = parser.parse_args(argv)
+
+    if args.houses < 1:
+        parser.error("--houses must be >= 1")
+    if not 0 <= args.solar <= args.houses:
+        parser.error("--solar must be between 0 and --houses")
+    if not 0 <= args.evs <= args.houses:
+        parser.error("--evs must be between 0 and --houses")
+    if not 0 <= args.smart <= args.evs:
+        parser.error("--smart must be between 0 and --evs")
+    if args.workers is not None and (args.export or args.profile or args.cprofile or args.engine == "dataframe"):
+        parser.error("--workers cannot be combined with --export, --profile, --cprofile or the dataframe engine")
+
+    print(f"startup: {(started - _IMPORT_STARTED) * 1000:.0f} ms (imports)", file=sys.stderr)
+
+    params = {"num_houses": args.houses, "num_solar": args.solar, "num_evs": args.evs,
+              "num_smart_evs": args.smart, "seed": args.seed, "hours": args.hours, "step_minutes": args.step,
+              "charging": args.charging, "panels": args.panels}
+    panel_kwp = LOGNORMAL_KWP if args.panels == LOGNORMAL_KWP else None
+    rng = np.random.default_rng(args.seed) if args.generator else None
+    profile = RunProfile(trace_memory=args.profile_memory) if args.profile else False
+    kwargs = dict(seed=args.seed, engine=args.engine, rng=rng, hours=args.hours, profile=profile, step_minutes=args.step,
+                  charging=args.charging, panel_kwp=panel_kwp)
+    t = time.perf_counter()
+    if args.workers is not None:
+        from sharded import run_sharded
+
+        res = run_sharded(args.houses, args.solar, args.evs, args.smart, seed=args.seed, workers=args.workers,
+                          engine=args.engine, hours=args.hours, step_minutes=args.step, charging=args.charging,
+                          panel_kwp=panel_kwp)
+    elif args.cprofile:
+        from profiling import profile_run
+        res = profile_run(args.cprofile, args.houses, args.solar, args.evs, args.smart, **kwargs)
+    else:
+        res = run_simulation(args.houses, args.solar, args.evs, args.smart, **kwargs)
+    print(f"simulation: {(time.perf_counter() - t) * 1000:.0f} ms", file=sys.stderr)
+    if args.profile:
+        print(format_profile(res["profile"]), file=sys.stderr)
+
+    if args.out:
+        _write_results(args.out, res, params)
+    if args.export:
+        from export import export_houses
+
+        export_houses(res, args.export)
+    if args.plot:
+        _plot_day(args.plot, res["per_hour"], args.day)
+
+    json.dump(_jsonable_totals(res["totals"]), sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
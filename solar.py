@@ -0,0 +1,42 @@
+import numpy as np
+
+# installed peak power of the system behind Solar_data_year.csv. The data does not
+# state it; about 4,270 kWh a year with a best hour of 2.6 kWh fits a ~4 kWp roof.
+# A house with scale 1.0 produces exactly the data.
+REFERENCE_KWP = 4.0
+# panel_kwp value that gives every solar house a drawn size (draw_panel_kwp)
+LOGNORMAL_KWP = "lognormal"
+
+
+def panel_scale(count, kwp=None, multiplier=None):
+    """
+    Per-house factor on the shared base profile for `count` solar houses:
+    kwp / REFERENCE_KWP times an orientation/shading multiplier. kwp and multiplier
+    are scalars or arrays of length count; None means the reference installation /
+    no loss, so panel_scale(n) is all ones.
+    """
+    scale = np.ones(count)
+    if kwp is not None:
+        scale = scale * (np.asarray(kwp, dtype=float) / REFERENCE_KWP)
+    if multiplier is not None:
+        scale = scale * np.asarray(multiplier, dtype=float)
+    if scale.shape != (count,):
+        raise ValueError(f"kwp and multiplier must be scalars or have one value per solar house ({count})")
+    if (scale < 0).any():
+        raise ValueError("panel sizes and multipliers must not be negative")
+    return scale
+
+
+def draw_panel_kwp(count, rng, mean_kwp=REFERENCE_KWP, sigma=0.3, min_kwp=1.0, max_kwp=12.0):
+    """Lognormal installation sizes (kWp) around mean_kwp, clipped to [min_kwp, max_kwp]."""
+    mu = np.log(mean_kwp) - sigma ** 2 / 2
+    return np.clip(rng.lognormal(mu, sigma, size=count), min_kwp, max_kwp)
+
+
+def resolve_panel_kwp(panel_kwp, count, rng):
+    """panel_kwp as given, or count sizes from draw_panel_kwp(count, rng) for LOGNORMAL_KWP."""
+    if isinstance(panel_kwp, str):
+        if panel_kwp != LOGNORMAL_KWP:
+            raise ValueError(f"panel_kwp must be a number, one per solar house or {LOGNORMAL_KWP!r}")
+        return draw_panel_kwp(count, rng)
+    return panel_kwp
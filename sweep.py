@@ -0,0 +1,68 @@
+import itertools
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from baseline import Baseline, simulate_baseline
+
+SWEEP_PARAMS = ("num_solar", "num_evs", "num_smart_evs")
+
+# Baseline of the current worker process (set once per worker by _init_worker)
+_worker_baseline = None
+
+
+def _init_worker(baseline):
+    global _worker_baseline
+    _worker_baseline = baseline
+
+
+def _run_point(point):
+    totals, _ = simulate_baseline(_worker_baseline, *point)
+    row = {k: float(v) for k, v in totals.items() if k != "counts"}
+    row.update(totals["counts"])
+    return row
+
+
+def expand_grid(grid):
+    """
+    Scenario points from a grid: a dict mapping num_solar / num_evs / num_smart_evs to
+    lists of values (cartesian product, points with num_smart_evs > num_evs dropped),
+    or an iterable of (num_solar, num_evs, num_smart_evs) tuples / dicts.
+    """
+    if isinstance(grid, dict):
+        unknown = set(grid) - set(SWEEP_PARAMS)
+        if unknown:
+            raise ValueError(f"unknown sweep parameters: {sorted(unknown)}")
+        values = [grid.get(name, [0]) for name in SWEEP_PARAMS]
+        return [p for p in itertools.product(*values) if p[2] <= p[1]]
+    return [tuple(p[name] for name in SWEEP_PARAMS) if isinstance(p, dict) else tuple(p) for p in grid]
+
+
+def run_sweep(num_houses, grid, seed=42, hours=168, workers=None):
+    """
+    Run every scenario point of grid (see expand_grid) for one neighbourhood.
+
+    Base loads, the aligned solar vector, house orderings and trip schedules are
+    computed once in a Baseline for (num_houses, seed, hours) and shared by all
+    points; only the charging is simulated per point. Points run in parallel on a
+    process pool (workers=1 runs them in this process), each worker receiving the
+    Baseline once.
+
+    Returns a DataFrame with one row per point: the sweep parameters and the
+    run_simulation totals and counts.
+    """
+    points = expand_grid(grid)
+    max_evs = max((p[1] for p in points), default=0)
+    baseline = Baseline(num_houses, seed=seed, hours=hours, max_evs=max_evs)
+    for point in points:
+        baseline.check(*point)
+
+    if workers == 1 or len(points) <= 1:
+        _init_worker(baseline)
+        rows = [_run_point(p) for p in points]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(baseline,)) as pool:
+            rows = list(pool.map(_run_point, points, chunksize=max(1, len(points) // 64)))
+
+    table = pd.DataFrame(rows)
+    params = pd.DataFrame(np.array(points, dtype=int).reshape(-1, 3), columns=list(SWEEP_PARAMS))
+    return pd.concat([params, table], axis=1)
@@ -0,0 +1,112 @@
+import numpy as np
+from functools import lru_cache
+
+# Both windows are inclusive (start hour, end hour) ranges of the hour of day. They
+# differ on purpose, as in model.py: the reported peak ends at 8 am, the reduced
+# charging power for smart EVs without solar lasts until 9 am.
+# hours counted as peak in the reported totals (6-8 am and 6-9 pm)
+PEAK_WINDOWS = ((6, 8), (18, 21))
+# hours in which smart EVs without solar charge at reduced power (6-9 am and 6-9 pm)
+REDUCED_POWER_WINDOWS = ((6, 9), (18, 21))
+
+
+@lru_cache(maxsize=None)
+def time_index(hours=168, start="2023-08-31", step_minutes=60):
+    """
+    Timestamps (datetime64[ns]) of every step of step_minutes in `hours` hours,
+    shared by every house (computed once per horizon and step).
+    """
+    steps = hours * 60 // step_minutes
+    time = np.datetime64(start, "m") + np.arange(steps) * np.timedelta64(step_minutes, "m")
+    time = time.astype("datetime64[ns]")
+    time.setflags(write=False)
+    return time
+
+
+def hour_of_day(time):
+    """Hour of the day (0..23) of datetime64 timestamps."""
+    return time.astype("datetime64[h]").astype(np.int64) % 24
+
+
+def _hours_in(windows):
+    return tuple(h for start, end in windows for h in range(start, end + 1))
+
+
+PEAK_HOURS = _hours_in(PEAK_WINDOWS)
+REDUCED_POWER_HOURS = _hours_in(REDUCED_POWER_WINDOWS)
+
+
+def _by_hour(hours):
+    """24-entry boolean lookup table, True for the given hours of the day."""
+    table = np.zeros(24, dtype=bool)
+    table[list(hours)] = True
+    return table
+
+
+class Tariff:
+    """
+    Time-of-use tariff: a price per kWh for every hour of the day.
+
+    bands maps a band name to (price, windows), windows being inclusive (start hour,
+    end hour) ranges; hours outside every band cost `default`. Later bands override
+    earlier ones where they overlap.
+    """
+
+    def __init__(self, bands, default=0.0):
+        self.bands = dict(bands)
+        self.default = default
+        self.hourly_price = np.full(24, float(default))
+        for price, windows in self.bands.values():
+            self.hourly_price[list(_hours_in(windows))] = price
+        self.hourly_price.setflags(write=False)
+
+    @classmethod
+    def flat(cls, price):
+        return cls({}, default=price)
+
+
+# example two-band tariff (EUR/kWh) with the reported peak hours as the expensive band
+DEFAULT_TARIFF = Tariff({"peak": (0.34, PEAK_WINDOWS)}, default=0.24)
+
+
+class TimeAxis:
+    """
+    Calendar of one run, computed once: the timestamps of every step and per-step
+    lookup arrays (hour of day, day index, peak and reduced-power masks, tariff
+    price). Charging and aggregation index these arrays by step instead of looking
+    at timestamps.
+    """
+
+    def __init__(self, hours=168, start="2023-08-31", step_minutes=60, tariff=DEFAULT_TARIFF):
+        self.hours = hours
+        self.step_minutes = step_minutes
+        self.steps_per_hour = 60 // step_minutes
+        self.time = time_index(hours, np.datetime64(start, "h"), step_minutes)
+        self.hour_of_day = hour_of_day(self.time)
+        # day of each step, counted from the first day of the axis
+        days = self.time.astype("datetime64[D]")
+        self.day = (days - days[0]).astype(np.int64) if len(days) else np.zeros(0, dtype=np.int64)
+        self.peak = _by_hour(PEAK_HOURS)[self.hour_of_day]
+        self.reduced_power = _by_hour(REDUCED_POWER_HOURS)[self.hour_of_day]
+        self.tariff = tariff
+        # price per Wh of every step
+        self.price_Wh = tariff.hourly_price[self.hour_of_day] / 1000
+        for array in (self.hour_of_day, self.day, self.peak, self.reduced_power, self.price_Wh):
+            array.setflags(write=False)
+
+    def __len__(self):
+        return len(self.time)
+
+    def cost(self, energy_Wh, tariff=None):
+        """
+        Energy cost of series of energy per step (... x steps, Wh) under the tariff
+        of this axis, or another one: one matrix product with the per-step prices.
+        """
+        price_Wh = self.price_Wh if tariff is None else tariff.hourly_price[self.hour_of_day] / 1000
+        return np.asarray(energy_Wh) @ price_Wh
+
+
+@lru_cache(maxsize=None)
+def time_axis(hours=168, start="2023-08-31", step_minutes=60, tariff=DEFAULT_TARIFF):
+    """Shared TimeAxis for a horizon, step and tariff (built once per process)."""
+    return TimeAxis(hours, start, step_minutes, tariff)
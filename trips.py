@@ -0,0 +1,50 @@
+import numpy as np
+
+# daily leave ~07:00 -1..+1 h and return ~19:00 -5..+1 h (same as sample_leave_return)
+LEAVE_HOUR = 7
+LEAVE_OFFSETS = (-1, 1)
+RETURN_HOUR = 19
+RETURN_OFFSETS = (-5, 1)
+
+
+def sample_trips(n_evs, days, rng, first_day=0):
+    """
+    Leave/return hours for n_evs EVs and `days` days at once, as two n_evs x days
+    integer arrays of hour indices (day d starts at hour 24*d).
+
+    Vectorized counterpart of simulation.sample_leave_return: the same uniform offsets
+    and the same correction (a return at or before leave moves to leave+8, capped at
+    23:00 of that day), drawn from rng (a numpy Generator) in two calls.
+    """
+    day_start = 24 * (first_day + np.arange(days))
+    leave = day_start + LEAVE_HOUR + rng.integers(LEAVE_OFFSETS[0], LEAVE_OFFSETS[1] + 1, size=(n_evs, days))
+    ret = day_start + RETURN_HOUR + rng.integers(RETURN_OFFSETS[0], RETURN_OFFSETS[1] + 1, size=(n_evs, days))
+    early = ret <= leave
+    if early.any():
+        ret = np.where(early, np.minimum(leave + 8, day_start + 23), ret)
+    return leave, ret
+
+
+def trips_from_intervals(intervals):
+    """(leave, ret) arrays from per-EV lists of (leave, return) tuples (sample_leave_return)."""
+    arr = np.asarray(intervals, dtype=np.intp)
+    if arr.size == 0:
+        return np.empty((0, 0), dtype=np.intp), np.empty((0, 0), dtype=np.intp)
+    return arr[..., 0], arr[..., 1]
+
+
+def presence_matrix(leave, ret, hours, offset=0):
+    """
+    EVs x hours boolean matrix, True while the car is at home, for hours
+    offset..offset+hours-1 of the run. A car is away from its leave hour up to (not
+    including) its return hour. Intervals are filled with a difference array and a
+    cumulative sum instead of a loop over hours.
+    """
+    n_evs = leave.shape[0]
+    start = np.clip(leave - offset, 0, hours).ravel()
+    stop = np.clip(ret - offset, 0, hours).ravel()
+    base = np.repeat(np.arange(n_evs) * (hours + 1), leave.shape[1] if leave.ndim > 1 else 1)
+    size = n_evs * (hours + 1)
+    diff = np.bincount(base + start, minlength=size) - np.bincount(base + stop, minlength=size)
+    diff = diff.reshape(n_evs, hours + 1)[:, :hours]
+    return np.cumsum(diff, axis=1) == 0